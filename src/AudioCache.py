@@ -0,0 +1,167 @@
+import hashlib
+import os
+import threading
+import numpy as np
+from typing import Optional, Tuple
+
+from visound.core.TraversalMode import TraversalMode
+
+from Synthesis import SynthesisEngine
+
+# Part of every key, bump it when the audio produced for the same image and
+# parameters changes, so stale entries are no longer found
+CACHE_VERSION = 3
+
+# Puts between scans of the cache directory while under the size cap, to
+# notice entries written by other processes
+RESCAN_PUTS = 64
+
+# Share of the size cap the cache is trimmed to once it is over it, so a
+# full cache is not scanned again on the next put
+EVICT_TO = 0.9
+
+
+def default_cache_dir() -> str:
+    base = os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "sonify-python")
+
+
+class AudioCache:
+    """
+    On-disk cache of sonified audio.
+
+    Entries are keyed by a hash of the image file contents and the sonify
+    parameters, and stored as `.npy` files so they can be memory mapped
+    back. The modification time of an entry is its last use, the least
+    recently used entries are removed once the cache grows past `max_bytes`.
+
+    One cache can be used from several threads.
+    """
+
+    def __init__(self, directory: Optional[str] = None,
+                 max_bytes: int = 1024 ** 3):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Size of the cache as of the last scan plus what was put since,
+        # None until the first scan
+        self._size: Optional[int] = None
+        self._puts = 0
+        # (path, size, mtime) -> hash of the file contents, copied for every
+        # key so changing only the parameters does not read the image again
+        self._file_hashes = {}
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, file_path: str, dimension: Tuple[int, int], dpc: float,
+            sample_rate: int, mode: TraversalMode,
+            engine: SynthesisEngine = SynthesisEngine.Oscillator) -> str:
+        """
+        Content address of the audio for an image and the sonify parameters
+        """
+        h = self._file_hash(file_path).copy()
+        h.update(repr((CACHE_VERSION, tuple(dimension), float(dpc),
+                       int(sample_rate), mode.name, engine.name)).encode())
+        return h.hexdigest()
+
+    def _file_hash(self, file_path: str):
+        st = os.stat(file_path)
+        file_key = (os.path.abspath(file_path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            h = self._file_hashes.get(file_key)
+        if h is None:
+            h = hashlib.sha256()
+            with open(file_path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            with self._lock:
+                if len(self._file_hashes) >= 64:
+                    self._file_hashes.clear()
+                self._file_hashes[file_key] = h
+        return h
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Memory map the cached audio, or None if it is not in the cache
+        """
+        path = self._path(key)
+        try:
+            audio = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return audio
+
+    def put(self, key: str, audio: np.ndarray) -> None:
+        """
+        Store the audio and evict old entries if over the size cap.
+
+        The directory is only scanned when the running size total passes
+        the cap, or every RESCAN_PUTS puts, not on every put.
+        """
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, audio)
+            written = f.tell()
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._puts += 1
+            if self._size is not None:
+                self._size += written
+            scan = (self._size is None or self._size > self.max_bytes
+                    or self._puts % RESCAN_PUTS == 0)
+        if scan:
+            self.evict()
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, st.st_size, st.st_mtime
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used entries until the cache fits, with
+        some room to spare
+        """
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TO if total > self.max_bytes else self.max_bytes
+
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+        with self._lock:
+            self._size = total
+
+    def clear(self) -> None:
+        for path, _, _ in list(self._entries()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._size = 0
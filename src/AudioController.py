@@ -1,7 +1,175 @@
 # audio_controller.py
+import bisect
 import sounddevice as sd
 import numpy as np
-from typing import Optional
+from dataclasses import dataclass, field, replace
+from time import perf_counter
+from typing import List, Optional
+from pedalboard import Pedalboard
+
+from AudioFormat import AUDIO_DTYPE, check_audio
+from EffectChain import EffectStream
+
+# Upper edges of the callback duration histogram buckets in seconds, one
+# more bucket counts everything slower
+CALLBACK_BUCKETS = [50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3,
+                    10e-3, 25e-3, 50e-3]
+
+
+@dataclass
+class CallbackStats:
+    """
+    Health of the audio callback since the playback parameters were set
+    """
+    callbacks: int = 0
+    # Blocks the device ran out of audio for, and gave up on
+    underflows: int = 0
+    overflows: int = 0
+    # Blocks where playback caught up with a GrowingBuffer's producer
+    producer_underruns: int = 0
+    # Callbacks that took longer than the block they produced lasts
+    late: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    # Smallest block period minus callback duration seen
+    min_margin_seconds: Optional[float] = None
+    block_seconds: Optional[float] = None
+    histogram: List[int] = field(
+        default_factory=lambda: [0] * (len(CALLBACK_BUCKETS) + 1))
+
+    def record(self, seconds: float, frames: int, samplerate: float) -> None:
+        """
+        Count one callback, on the audio thread. Only this thread writes,
+        readers take a snapshot, so there is no lock.
+        """
+        self.callbacks += 1
+        self.total_seconds += seconds
+        self.histogram[bisect.bisect_left(CALLBACK_BUCKETS, seconds)] += 1
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+        self.block_seconds = frames / samplerate
+        margin = self.block_seconds - seconds
+        if margin < 0:
+            self.late += 1
+        if self.min_margin_seconds is None or margin < self.min_margin_seconds:
+            self.min_margin_seconds = margin
+
+    def snapshot(self) -> "CallbackStats":
+        return replace(self, histogram=list(self.histogram))
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.callbacks if self.callbacks else 0.0
+
+    def percentile(self, q: float) -> float:
+        """
+        Upper bound of the callback duration `q` (0 to 1) of the callbacks
+        stayed under, to the histogram's resolution
+        """
+        count = 0
+        for edge, n in zip(CALLBACK_BUCKETS, self.histogram):
+            count += n
+            if count >= q * self.callbacks:
+                return min(edge, self.max_seconds)
+        return self.max_seconds
+
+    def summary(self) -> str:
+        if not self.callbacks:
+            return "No callbacks yet"
+        return (f"{self.callbacks} callbacks: mean {self.mean_seconds * 1000:.3f} ms, "
+                f"p99 {self.percentile(0.99) * 1000:.3f} ms, "
+                f"max {self.max_seconds * 1000:.3f} ms of "
+                f"{self.block_seconds * 1000:.1f} ms blocks, "
+                f"{self.late} late, {self.underflows} underflows, "
+                f"{self.overflows} overflows, "
+                f"{self.producer_underruns} producer underruns")
+
+
+class GrowingBuffer:
+    """
+    Audio filled in by a producer while it is being played. Frames before
+    `ready` are final and can be played.
+    """
+
+    def __init__(self, total_frames: int):
+        # Shaped like the stream's outdata, see AudioController
+        self.data = np.zeros((total_frames, 1), dtype=AUDIO_DTYPE)
+        self.ready = 0
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def write(self, start: int, chunk: np.ndarray):
+        """
+        Add a chunk starting at frame `start`. Chunks must come in order,
+        so everything before `start` is final once it is written.
+        """
+        end = min(start + len(chunk), len(self.data))
+        self.data[start:end, 0] += chunk[:end - start]
+        self.ready = max(self.ready, start)
+
+    def finish(self):
+        self.ready = len(self.data)
+
+    @property
+    def complete(self) -> bool:
+        return self.ready >= len(self.data)
+
+
+class RingBuffer:
+    """
+    Bounded audio fed by a producer while it plays, for sources too long
+    to hold, like a video. One producer thread writes and the audio
+    callback reads, each side only advances its own counter.
+
+    `missed` counts the frames of silence played because the ring ran dry
+    before the producer finished, how far the audio fell behind.
+    """
+
+    def __init__(self, capacity: int):
+        # Shaped like the stream's outdata, see AudioController
+        self.data = np.zeros((capacity, 1), dtype=AUDIO_DTYPE)
+        self.written = 0
+        self.read = 0
+        self.missed = 0
+        self.finished = False
+
+    @property
+    def available(self) -> int:
+        return self.written - self.read
+
+    @property
+    def space(self) -> int:
+        return len(self.data) - self.available
+
+    def write(self, chunk: np.ndarray) -> int:
+        """
+        Add as much of `chunk` as fits, returns the number of frames added
+        """
+        n = min(len(chunk), self.space)
+        start = self.written % len(self.data)
+        first = min(n, len(self.data) - start)
+        self.data[start:start + first, 0] = chunk[:first]
+        self.data[:n - first, 0] = chunk[first:n]
+        self.written += n
+        return n
+
+    def read_into(self, out: np.ndarray, frames: int) -> int:
+        """
+        Copy up to `frames` frames into `out`, returns how many there were
+        """
+        n = min(frames, self.available)
+        start = self.read % len(self.data)
+        first = min(n, len(self.data) - start)
+        out[:first] = self.data[start:start + first]
+        out[first:n] = self.data[:n - first]
+        self.read += n
+        return n
+
+    def finish(self):
+        self.finished = True
+
 
 class AudioController:
     def __init__(self, audio: Optional[np.ndarray] = None,
@@ -12,41 +180,252 @@ class AudioController:
         self.current_frame = 0
         self.blocksize = 1024
         self.playing = False
+        self.effects: Optional[Pedalboard] = None
+        self._effect_stream: Optional[EffectStream] = None
+        # Written by the callback only, read through stats()
+        self._stats = CallbackStats()
+        self._growing: Optional[GrowingBuffer] = None
+        self._ring: Optional[RingBuffer] = None
+        # (first frame, DAC time) of the last block handed to the device
+        self._block_timing = None
+        # Playback storage, float32 and shaped like the stream's outdata so
+        # the callback only copies slices
+        self._buffer: Optional[np.ndarray] = None
+        self._block = np.zeros(self.blocksize, dtype=np.float32)
+        # (audio, buffer) to continue with when the current audio ends
+        self._next = None
+        # Number of gapless transitions into queued audio so far
+        self.track = 0
+        if audio is not None:
+            self._buffer = self._as_buffer(audio)
+
+    def set_effects(self, effects: Optional[Pedalboard]):
+        """
+        Set the pedalboard run over every block during playback, it is
+        picked up from the next block on. The plugins keep their state
+        between blocks, so reverb and delay tails carry over. Plugins with
+        latency delay the effected audio by `effects_latency` frames.
+        """
+        self._effect_stream = (EffectStream(effects, self.samplerate or 44100)
+                               if effects is not None else None)
+        self.effects = effects
+
+    @property
+    def effects_latency(self) -> int:
+        """
+        Frames the live effects run behind the playback position
+        """
+        stream = self._effect_stream
+        return stream.latency if stream is not None else 0
+
+    @staticmethod
+    def _as_buffer(audio: np.ndarray) -> np.ndarray:
+        # A view for contiguous AUDIO_DTYPE audio, flagged if it had to copy
+        return check_audio("playback", np.ascontiguousarray(
+            audio, dtype=AUDIO_DTYPE).reshape(-1, 1), source=audio)
+
+    def set_audio(self, audio: np.ndarray):
+        """
+        Swap the audio being played, keeping the playback position. The
+        new audio must have the same length.
+        """
+        self._buffer = self._as_buffer(audio)
+        self.audio = audio
+
+    def queue_next(self, audio: np.ndarray):
+        """
+        Continue with `audio` when the current audio ends, within the same
+        block so there is no gap. Playback keeps the samplerate and the
+        effects, and `track` counts up when the switch happens.
+        """
+        self._next = (audio, self._as_buffer(audio))
+
+    @property
+    def queued(self) -> bool:
+        return self._next is not None
+
+    def set_stream(self, growing: GrowingBuffer, samplerate: float):
+        """
+        Play audio that is still being produced. Playback only goes up to
+        the ready frames; when it catches up it plays silence, holds the
+        position and counts a producer underrun until more is ready.
+        """
+        self.set_params(growing.data[:, 0], samplerate)
+        self._buffer = growing.data
+        self._growing = growing
+
+    def set_ring(self, ring: RingBuffer, samplerate: float):
+        """
+        Play audio as it comes through a ring buffer. The position counts
+        the frames played; it holds while the ring is empty and playback
+        stops once the ring is finished and drained. Seeking does nothing.
+        """
+        self.set_params(ring.data[:, 0], samplerate)
+        self._ring = ring
 
     def set_params(self, audio: np.ndarray, samplerate: float):
         self.audio = audio
+        self._buffer = self._as_buffer(audio)
+        self._growing = None
+        self._ring = None
+        self._next = None
+        self._stats = CallbackStats()
         self.samplerate = samplerate
         self.current_frame = 0
+        self._block_timing = None
         self.playing = False
+        self._reset_effects()
         if self.stream:
             self.stream.close()
             self.stream = None
 
+    def stats(self) -> CallbackStats:
+        """
+        Snapshot of the callback's health, safe to poll from any thread
+        """
+        return self._stats.snapshot()
+
     def callback(self, outdata: np.ndarray, frames: int, time, status):
-        if not self.playing or self.audio is None:
-            outdata[:] = np.zeros((frames, 1))
+        start = perf_counter()
+        try:
+            self._fill(outdata, frames, time, status)
+        finally:
+            self._stats.record(perf_counter() - start, frames, self.samplerate)
+
+    def _fill(self, outdata: np.ndarray, frames: int, time, status):
+        # Runs on the audio thread: only slice copies into preallocated
+        # storage, nothing here should allocate
+        stats = self._stats
+        if status.output_underflow:
+            stats.underflows += 1
+        if status.output_overflow:
+            stats.overflows += 1
+
+        buffer = self._buffer
+        if not self.playing or buffer is None:
+            outdata.fill(0)
             raise sd.CallbackStop
 
-        chunk = self.audio[self.current_frame:self.current_frame + frames]
-        if len(chunk) < frames:
-            chunk = np.pad(chunk, (0, frames - len(chunk)))
+        ring = self._ring
+        if ring is not None:
+            self._fill_from_ring(ring, outdata, frames, time)
+            return
+
+        growing = self._growing
+        end = len(buffer) if growing is None else growing.ready
 
-        outdata[:] = chunk.reshape(-1, 1)
-        self.current_frame += frames
+        start = self.current_frame
+        self._block_timing = (start, time.outputBufferDacTime)
+        n = max(min(frames, end - start), 0)
+        outdata[:n] = buffer[start:start + n]
 
-        if self.current_frame >= len(self.audio):
+        queued = self._next
+        if queued is not None and n < frames and end == len(buffer):
+            # Gapless transition: the rest of the block is the start of the
+            # queued audio, and positions count from its first frame
+            self._next = None
+            self.audio, buffer = queued
+            self._buffer = buffer
+            self._growing = None
+            self.track += 1
+            start = -n
+            self.current_frame = start
+            self._block_timing = (start, time.outputBufferDacTime)
+            end = len(buffer)
+            n += min(frames - n, end)
+            outdata[-start:n] = buffer[:n + start]
+        outdata[n:].fill(0)
+        self._apply_effects(outdata, frames)
+
+        if end < len(buffer) and n < frames:
+            # The producer is behind: the rest of the block is silence and
+            # playback resumes from where the ready audio ends
+            stats.producer_underruns += 1
+            self.current_frame += n
+        else:
+            self.current_frame += frames
+
+        if self.current_frame >= len(buffer) and self._next is None:
             self.playing = False
             raise sd.CallbackStop
 
+    def _fill_from_ring(self, ring: RingBuffer, outdata: np.ndarray, frames: int, time):
+        self._block_timing = (self.current_frame, time.outputBufferDacTime)
+        n = ring.read_into(outdata, frames)
+        outdata[n:].fill(0)
+        self._apply_effects(outdata, frames)
+        self.current_frame += n
+
+        if n < frames:
+            if not ring.finished:
+                self._stats.producer_underruns += 1
+                ring.missed += frames - n
+            elif ring.available == 0:
+                self.playing = False
+                raise sd.CallbackStop
+
+    def _apply_effects(self, outdata: np.ndarray, frames: int):
+        stream = self._effect_stream
+        if stream is not None and len(stream.pedalboard) > 0:
+            if len(self._block) < frames:
+                self._block = np.zeros(frames, dtype=np.float32)
+            block = self._block[:frames]
+            block[:] = outdata[:, 0]
+            # pedalboard returns a new array, live effects are the one
+            # path that allocates
+            stream.sample_rate = self.samplerate
+            stream.process(block, outdata[:, 0])
+
+    def position(self) -> float:
+        """
+        Position in seconds of the audio coming out of the device right
+        now, from the frames handed to the stream and the stream clock.
+        While paused this is where playback resumes from.
+        """
+        if self.samplerate is None:
+            return 0.0
+
+        timing = self._block_timing
+        if not self.playing or self.stream is None or timing is None:
+            return self.current_frame / self.samplerate
+
+        frame, dac_time = timing
+        seconds = frame / self.samplerate + (self.stream.time - dac_time)
+        return min(max(seconds, 0.0), self.current_frame / self.samplerate)
+
+    def duration(self) -> float:
+        if self._buffer is None or self.samplerate is None:
+            return 0.0
+        return len(self._buffer) / self.samplerate
+
+    def seek(self, seconds: float):
+        """
+        Move the playback position, clamped to the audio
+        """
+        if self._buffer is None or self.samplerate is None or self._ring is not None:
+            return
+        frame = int(round(seconds * self.samplerate))
+        self.current_frame = min(max(frame, 0), len(self._buffer))
+        self._block_timing = None
+        self._reset_effects()
+
+    def _reset_effects(self):
+        if self._effect_stream is not None:
+            self._effect_stream.reset()
+
     def reset(self):
         self.playing = False
         self.current_frame = 0
-        self.stream.stop()
+        self._block_timing = None
+        if self.stream:
+            self.stream.stop()
+        self._reset_effects()
 
     def pause(self):
         if self.stream and self.playing:
             self.stream.stop()
             self.playing = False
+            self._block_timing = None
 
     def resume(self):
         if self.audio is None or self.samplerate is None:
@@ -55,6 +434,7 @@ class AudioController:
         if self.stream is None:
             self.stream = sd.OutputStream(samplerate=self.samplerate,
                                           channels=1,
+                                          dtype="float32",
                                           callback=self.callback,
                                           blocksize=self.blocksize)
         if not self.playing:
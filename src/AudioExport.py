@@ -0,0 +1,130 @@
+import os
+import numpy as np
+import soundfile as sf
+from typing import Callable, Iterable, Iterator, Optional
+
+from pedalboard import Pedalboard
+from visound.core.TraversalMode import TraversalMode
+
+from AudioFormat import AUDIO_DTYPE, check_audio
+from EffectChain import LATENCY_PLUGINS
+from Synthesis import SynthesisEngine, stream, total_samples
+from Tracing import span
+
+# Frames written per SoundFile.write call
+EXPORT_BLOCK = 65536
+
+# Formats offered for saving audio: name -> (soundfile format, subtype, extension)
+EXPORT_FORMATS = {
+    "WAV 16-bit": ("WAV", "PCM_16", ".wav"),
+    "WAV 24-bit": ("WAV", "PCM_24", ".wav"),
+    "WAV 32-bit float": ("WAV", "FLOAT", ".wav"),
+    "FLAC 16-bit": ("FLAC", "PCM_16", ".flac"),
+    "FLAC 24-bit": ("FLAC", "PCM_24", ".flac"),
+    "OGG Vorbis": ("OGG", "VORBIS", ".ogg"),
+}
+
+
+def array_blocks(audio: np.ndarray, block: int = EXPORT_BLOCK) -> Iterator[np.ndarray]:
+    """
+    Views of `audio`, `block` frames at a time
+    """
+    for start in range(0, len(audio), block):
+        yield audio[start:start + block]
+
+
+def render_blocks(image: np.ndarray, mode: TraversalMode, dpc: float,
+                  sample_rate: int,
+                  engine: SynthesisEngine = SynthesisEngine.Oscillator,
+                  block: int = EXPORT_BLOCK) -> Iterator[np.ndarray]:
+    """
+    Sonify `image` into consecutive blocks of `block` frames, scaled like
+    Renderer.render. Only the blocks still being added to are in memory,
+    never the whole audio.
+    """
+    total = total_samples(image.shape, mode, dpc, sample_rate)
+    # Frames from `base` on, the chunks of Synthesis.stream are added here
+    # until a chunk starts past the first block, which is then final
+    pending = np.zeros(2 * block, dtype=AUDIO_DTYPE)
+    base = 0
+
+    def flush() -> np.ndarray:
+        nonlocal base
+        done = pending[:min(block, total - base)] * 0.5
+        pending[:-block] = pending[block:]
+        pending[-block:] = 0
+        base += block
+        return done
+
+    for start, chunk in stream(image, mode, dpc, sample_rate, engine):
+        while start - base >= block:
+            yield flush()
+
+        end = start + len(chunk) - base
+        if end > len(pending):
+            pending = np.concatenate([pending, np.zeros(end - len(pending), AUDIO_DTYPE)])
+        pending[start - base:end] += chunk
+
+    # The rest, and any silence the traversal ends with
+    while base < total:
+        yield flush()
+
+
+def apply_effects(blocks: Iterable[np.ndarray], pedalboard: Optional[Pedalboard],
+                  sample_rate: int) -> Iterator[np.ndarray]:
+    """
+    Run the blocks through the pedalboard as one stream, with reverb and
+    delay tails carried over from block to block, so the output is the
+    same as a whole render.
+
+    Plugins with latency, like PitchShift, only give their full output on
+    a whole buffer. A chain with one is rendered in one piece, which holds
+    the whole audio in memory.
+    """
+    if pedalboard is None or len(pedalboard) == 0:
+        yield from blocks
+        return
+
+    pedalboard.reset()
+    if any(isinstance(plugin, LATENCY_PLUGINS) for plugin in pedalboard):
+        audio = np.concatenate(list(blocks))
+        with span("effects", frames=len(audio)):
+            audio = check_audio("effects", pedalboard(audio, sample_rate))
+        yield from array_blocks(audio)
+        return
+
+    for block in blocks:
+        with span("effects", frames=len(block)):
+            yield check_audio("effects", pedalboard(block, sample_rate, reset=False))
+
+
+def export_audio(path: str, blocks: Iterable[np.ndarray], sample_rate: int,
+                 format: str, subtype: str, total_frames: int,
+                 progress: Optional[Callable[[int, int], bool]] = None) -> bool:
+    """
+    Write the audio `blocks` to `path` as they come, through a SoundFile.
+
+    Integer subtypes clip the audio to [-1, 1] instead of wrapping around.
+    `progress` is called with the frames written and `total_frames` after
+    every block; if it returns False the export stops, the partial file is
+    removed and False is returned.
+    """
+    clip = subtype.startswith("PCM")
+    written = 0
+    try:
+        with sf.SoundFile(path, "w", sample_rate, 1, subtype, format=format) as f:
+            for block in blocks:
+                with span("write block", frames=len(block)):
+                    f.write(np.clip(block, -1, 1) if clip else block)
+                written += len(block)
+                if progress is not None and progress(written, total_frames) is False:
+                    break
+            else:
+                return True
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    os.remove(path)
+    return False
@@ -0,0 +1,33 @@
+import warnings
+import numpy as np
+from typing import Optional
+
+# Sample type of all audio, from synthesis to the output stream. Pedalboard
+# and the output stream work in float32, anything wider is converted
+# (and copied) on the way, and doubles the memory of long renders
+AUDIO_DTYPE = np.float32
+
+
+class AudioFormatWarning(UserWarning):
+    """
+    A stage produced audio of another dtype, or copied audio it was
+    expected to pass through. `warnings.simplefilter("error",
+    AudioFormatWarning)` turns these into errors.
+    """
+
+
+def check_audio(stage: str, audio: np.ndarray,
+                source: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Warn if `audio`, the output of `stage`, is not AUDIO_DTYPE, or, when
+    `source` is given, if it is a copy of `source` rather than a view of
+    it. Returns `audio` unchanged.
+    """
+    if audio.dtype != AUDIO_DTYPE:
+        warnings.warn(f"{stage}: {audio.dtype} audio, expected "
+                      f"{np.dtype(AUDIO_DTYPE)}", AudioFormatWarning,
+                      stacklevel=2)
+    if source is not None and not np.may_share_memory(audio, source):
+        warnings.warn(f"{stage}: copied {audio.nbytes / 1024 ** 2:.1f} MB "
+                      f"of audio", AudioFormatWarning, stacklevel=2)
+    return audio
@@ -0,0 +1,72 @@
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QLabel, QPushButton
+from PyQt6.QtCore import QTimer
+from PyQt6.QtGui import QFontDatabase
+
+from AudioController import AudioController, CALLBACK_BUCKETS
+
+
+def _format_seconds(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.0f} us"
+    return f"{seconds * 1e3:g} ms"
+
+
+class AudioHealthDialog(QDialog):
+    """
+    Live view of the audio callback's cost against the block period and
+    the xrun counters, polled from the audio controller
+    """
+
+    def __init__(self, controller: AudioController, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Audio Health")
+        self._controller = controller
+
+        layout = QVBoxLayout()
+        self._label = QLabel()
+        self._label.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        layout.addWidget(self._label)
+
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close)
+        layout.addWidget(close_button)
+        self.setLayout(layout)
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(500)
+        self._timer.timeout.connect(self.refresh)
+        self._timer.start()
+        self.refresh()
+
+    def refresh(self) -> None:
+        stats = self._controller.stats()
+        lines = [f"Block size:   {self._controller.blocksize} frames"]
+
+        if stats.callbacks:
+            lines += [
+                f"Block period: {stats.block_seconds * 1000:.2f} ms",
+                f"Callbacks:    {stats.callbacks}",
+                f"Mean:         {stats.mean_seconds * 1000:.3f} ms",
+                f"p99:          {stats.percentile(0.99) * 1000:.3f} ms",
+                f"Max:          {stats.max_seconds * 1000:.3f} ms",
+                f"Min margin:   {stats.min_margin_seconds * 1000:.3f} ms",
+                f"Late:         {stats.late}",
+            ]
+        else:
+            lines.append("No callbacks yet, start playback")
+
+        lines += [
+            f"Underflows:   {stats.underflows}",
+            f"Overflows:    {stats.overflows}",
+            f"Producer underruns: {stats.producer_underruns}",
+            "",
+            "Callback duration:",
+        ]
+
+        peak = max(stats.histogram) or 1
+        edges = [_format_seconds(edge) for edge in CALLBACK_BUCKETS]
+        labels = [f"< {edge}" for edge in edges] + [f">= {edges[-1]}"]
+        for label, count in zip(labels, stats.histogram):
+            lines.append(f"{label:>10} {count:>8} {'#' * (30 * count // peak)}")
+
+        self._label.setText("\n".join(lines))
@@ -0,0 +1,389 @@
+from pedalboard import (Pedalboard, Compressor, Reverb, Phaser, PitchShift,
+    Delay, Distortion, Chorus, Limiter, LadderFilter, Gain, Convolution,
+    HighpassFilter, LowpassFilter)
+import json
+import os
+import threading
+import numpy as np
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from AudioFormat import AUDIO_DTYPE, check_audio
+from Tracing import span
+
+# Effect names understood by the command line tools, mapped to the
+# pedalboard plugin they build
+EFFECTS = {
+    "compressor": Compressor,
+    "reverb": Reverb,
+    "phaser": Phaser,
+    "pitchshift": PitchShift,
+    "delay": Delay,
+    "distortion": Distortion,
+    "chorus": Chorus,
+    "limiter": Limiter,
+    "ladder": LadderFilter,
+    "gain": Gain,
+    "highpass": HighpassFilter,
+    "lowpass": LowpassFilter,
+    "convolution": Convolution,
+}
+
+EffectSpec = Tuple[str, Dict]
+
+
+def parse_effect(spec: str) -> EffectSpec:
+    """
+    Parse an effect given as `name:key=value,key=value`, for example
+    `reverb:room_size=0.5`. The parameter names are the same as the ones
+    returned by the `get_parameters` of the effect dialogs.
+    """
+    name, _, options = spec.partition(":")
+    name = name.strip().lower()
+
+    if name not in EFFECTS:
+        raise ValueError(f"Unknown effect '{name}', expected one of: "
+                         + ", ".join(EFFECTS))
+
+    params = {}
+    for option in filter(None, options.split(",")):
+        key, sep, value = option.partition("=")
+        if not sep:
+            raise ValueError(f"Effect option '{option}' is not of the form key=value")
+        try:
+            params[key.strip()] = float(value)
+        except ValueError:
+            params[key.strip()] = value.strip()
+
+    return name, params
+
+
+def build_pedalboard(chain: List[EffectSpec]) -> Pedalboard:
+    """
+    Build a pedalboard from a list of (name, parameters) pairs
+    """
+    return Pedalboard([EFFECTS[name](**params) for name, params in chain])
+
+
+def preset_dir() -> str:
+    base = os.getenv("XDG_CONFIG_HOME", os.path.join(os.path.expanduser("~"), ".config"))
+    return os.path.join(base, "sonify-python", "presets")
+
+
+def save_preset(path: str, chain: List[EffectSpec]) -> None:
+    """
+    Write an effect chain as JSON, every effect with the parameters from
+    its dialog's `get_parameters`
+    """
+    with open(path, "w") as f:
+        json.dump({"effects": [{"name": name, "params": params}
+                               for name, params in chain]}, f, indent=2)
+
+
+def load_preset(path: str) -> List[EffectSpec]:
+    """
+    Read an effect chain written by `save_preset`. Raises ValueError if an
+    effect or parameter is not known.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    return parse_chain(data, path)
+
+
+def parse_chain(data, source: str = "effect chain") -> List[EffectSpec]:
+    """
+    Effect chain from the JSON of a preset, `{"effects": [{"name": ...,
+    "params": {...}}, ...]}`. Raises ValueError naming `source` if an
+    effect or parameter is not known.
+    """
+    try:
+        chain = [(effect["name"], dict(effect.get("params", {})))
+                 for effect in data["effects"]]
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"{source} is not an effect preset: {e}")
+
+    for name, params in chain:
+        if name not in EFFECTS:
+            raise ValueError(f"Unknown effect '{name}' in {source}")
+    try:
+        build_pedalboard(chain)
+    except TypeError as e:
+        raise ValueError(f"Invalid parameters in {source}: {e}")
+    return chain
+
+
+def render_variants(audio: np.ndarray, sample_rate: float,
+                    chains: List[List[EffectSpec]], workers: Optional[int] = None,
+                    progress: Optional[Callable[[int, int], None]] = None) -> List[np.ndarray]:
+    """
+    Apply every chain to the same audio, in parallel. Pedalboard releases
+    the GIL while it processes, so threads spread the chains over the cores
+    without copying the audio to other processes.
+    """
+    def apply(index: int, chain: List[EffectSpec]) -> np.ndarray:
+        with span("variant", index=index, stages=len(chain)):
+            return check_audio(f"variant {index}",
+                               build_pedalboard(chain)(audio, sample_rate))
+
+    results = [None] * len(chains)
+    workers = max(1, min(workers or os.cpu_count(), len(chains)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(apply, i, chain): i for i, chain in enumerate(chains)}
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if progress is not None:
+                progress(done, len(chains))
+    return results
+
+
+# Plugins that hold audio back when run block by block. PitchShift returns
+# nothing for small blocks and gaps of silence for large ones with
+# `reset=False`, only a whole call gives its full output.
+LATENCY_PLUGINS = (PitchShift,)
+
+
+class _ChunkedPlugins:
+    """
+    Runs plugins with latency over `CHUNK` frames at a time, every chunk a
+    whole call after `PREROLL` frames of the input before it, so the
+    plugins are settled by the time the chunk starts. Consecutive chunks
+    overlap by `CROSSFADE` frames, faded into each other. The output runs
+    `DELAY` frames late and starts with that much silence, so it never
+    falls behind the input.
+
+    In `realtime` mode the chunks render on a thread and `feed` only
+    returns the ones that are done, otherwise it waits for them.
+    """
+
+    CHUNK = 1 << 14
+    PREROLL = 1 << 14
+    CROSSFADE = 1 << 10
+    DELAY = CHUNK + CROSSFADE
+
+    def __init__(self, pedalboard: Pedalboard, realtime: bool):
+        self.pedalboard = pedalboard
+        self._executor = ThreadPoolExecutor(max_workers=1) if realtime else None
+        self._ramp = np.linspace(0, 1, self.CROSSFADE, dtype=AUDIO_DTYPE)
+        self.reset()
+
+    def reset(self) -> None:
+        # Input from the start of the next chunk's preroll on
+        self._input = np.zeros(0, dtype=AUDIO_DTYPE)
+        self._preroll = 0
+        # Renders in chunk order, ones dropped by a reset finish unread
+        self._renders = deque()
+        # End of the last chunk, faded into the next one
+        self._tail = None
+        self._silence = self.DELAY
+
+    def _render(self, window: np.ndarray, sample_rate: float) -> np.ndarray:
+        return self.pedalboard(window, sample_rate, reset=True).reshape(-1)
+
+    def feed(self, block: np.ndarray, sample_rate: float) -> np.ndarray:
+        """
+        Take a block of input and return the output that is ready
+        """
+        done = []
+        if self._silence > 0:
+            frames = min(len(block), self._silence)
+            done.append(np.zeros(frames, dtype=AUDIO_DTYPE))
+            self._silence -= frames
+
+        self._input = np.concatenate([self._input, block])
+        while len(self._input) - self._preroll >= self.CHUNK:
+            end = self._preroll + self.CHUNK
+            window = self._input[:end]
+            if self._executor is not None:
+                render = self._executor.submit(self._render, window, sample_rate)
+            else:
+                render = Future()
+                render.set_result(self._render(window, sample_rate))
+            self._renders.append(render)
+            self._preroll = min(end, self.PREROLL)
+            self._input = self._input[end - self._preroll:]
+
+        while self._renders and self._renders[0].done():
+            output = self._renders.popleft().result()
+            if self._silence > 0:
+                # The rest of the silence goes in front of the first chunk
+                done.append(np.zeros(self._silence, dtype=AUDIO_DTYPE))
+                self._silence = 0
+            if self._tail is None:
+                cut = self.CHUNK - self.CROSSFADE
+            else:
+                output = output[-(self.CHUNK + self.CROSSFADE):]
+                output[:self.CROSSFADE] = (self._tail * (1 - self._ramp)
+                                           + output[:self.CROSSFADE] * self._ramp)
+                cut = self.CHUNK
+            done.append(output[:cut])
+            self._tail = output[cut:]
+        return np.concatenate(done) if done else block[:0]
+
+
+class EffectStream:
+    """
+    Runs a pedalboard over consecutive blocks and returns exactly as many
+    frames as it is given, for playback where every block has to be full.
+
+    Runs of plugins without latency process each block as it comes with
+    `reset=False`, so reverb and delay tails carry over. Plugins with
+    latency, like PitchShift, only work on a whole buffer and are rendered
+    a chunk at a time instead. Frames not ready yet are made up with
+    silence in front of what is, so the output is the effected audio
+    running `latency` frames late. Frames past the block wait in a FIFO
+    for the next one.
+
+    With `realtime` chunks render on a thread and a chunk still rendering
+    is made up with silence instead of being waited for, which is what
+    an audio callback needs.
+    """
+
+    def __init__(self, pedalboard: Pedalboard, sample_rate: float,
+                 capacity: int = 1 << 16, realtime: bool = True):
+        self.pedalboard = pedalboard
+        self.sample_rate = sample_rate
+        # Frames of silence put in so far
+        self._padded = 0
+        self._stages = []
+        plugins = list(pedalboard)
+        while plugins:
+            chunked = isinstance(plugins[0], LATENCY_PLUGINS)
+            count = next((i for i, plugin in enumerate(plugins)
+                          if isinstance(plugin, LATENCY_PLUGINS) != chunked), len(plugins))
+            board = Pedalboard(plugins[:count])
+            self._stages.append(_ChunkedPlugins(board, realtime) if chunked else board)
+            plugins = plugins[count:]
+        self._fifo = np.zeros(capacity, dtype=AUDIO_DTYPE)
+        self._count = 0
+
+    def reset(self) -> None:
+        self.pedalboard.reset()
+        for stage in self._stages:
+            if isinstance(stage, _ChunkedPlugins):
+                stage.reset()
+        self._padded = 0
+        self._count = 0
+
+    @property
+    def latency(self) -> int:
+        """
+        Frames the output runs behind the input
+        """
+        return self._padded + sum(stage.DELAY for stage in self._stages
+                                  if isinstance(stage, _ChunkedPlugins))
+
+    def process(self, block: np.ndarray, out: np.ndarray) -> None:
+        """
+        Run `block` through the pedalboard into `out`, which has its length
+        """
+        frames = len(block)
+        done = block
+        for stage in self._stages:
+            if len(done) == 0:
+                break
+            if isinstance(stage, _ChunkedPlugins):
+                done = stage.feed(done, self.sample_rate)
+            else:
+                done = stage(done, self.sample_rate, reset=False).reshape(-1)
+
+        count = self._count + len(done)
+        if count > len(self._fifo):
+            # Only when a plugin hands back more than the FIFO has room for
+            self._fifo = np.concatenate([self._fifo[:self._count],
+                                         np.zeros(count, dtype=AUDIO_DTYPE)])
+        self._fifo[self._count:count] = done
+
+        if count < frames:
+            missing = frames - count
+            out[:missing] = 0
+            out[missing:frames] = self._fifo[:count]
+            self._padded += missing
+            self._count = 0
+        else:
+            out[:frames] = self._fifo[:frames]
+            self._fifo[:count - frames] = self._fifo[frames:count]
+            self._count = count - frames
+
+
+def _signature(spec: EffectSpec) -> Tuple:
+    name, params = spec
+    return name, tuple(sorted(params.items()))
+
+
+class EffectChainRenderer:
+    """
+    Renders an effect chain one stage at a time and keeps the buffer after
+    every stage. When the chain is rendered again for the same source, only
+    the stages from the first changed one onwards are run again.
+
+    The kept buffers are limited to `max_bytes`; past that the earliest
+    stages are dropped first, since edits usually happen at the end of the
+    chain.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.rendered_stages = 0
+        self._lock = threading.Lock()
+        self._source_key = None
+        # (signature, buffer after the stage or None if evicted)
+        self._stages: List[Tuple[Tuple, Optional[np.ndarray]]] = []
+
+    def clear(self) -> None:
+        with self._lock:
+            self._source_key = None
+            self._stages = []
+
+    def cached_bytes(self) -> int:
+        return sum(buf.nbytes for _, buf in self._stages if buf is not None)
+
+    def _evict(self) -> None:
+        for i, (sig, buf) in enumerate(self._stages):
+            if self.cached_bytes() <= self.max_bytes:
+                break
+            self._stages[i] = (sig, None)
+
+    def render(self, source_key: Hashable, audio: np.ndarray, sample_rate: float,
+               chain: List[EffectSpec],
+               progress: Optional[Callable[[int, int], bool]] = None) -> Optional[np.ndarray]:
+        """
+        Apply the chain to `audio`, which is identified by `source_key`.
+
+        `progress` is called with the index of the stage about to run and
+        the number of stages; if it returns False None is returned, and the
+        stages rendered so far are kept.
+        """
+        with self._lock:
+            if source_key != self._source_key:
+                self._source_key = source_key
+                self._stages = []
+
+            signatures = [_signature(spec) for spec in chain]
+
+            valid = 0
+            while (valid < min(len(signatures), len(self._stages))
+                   and self._stages[valid][0] == signatures[valid]):
+                valid += 1
+
+            # Resume from the last stage of the valid prefix that still
+            # has its buffer
+            start = valid
+            while start > 0 and self._stages[start - 1][1] is None:
+                start -= 1
+            del self._stages[start:]
+
+            buf = audio if start == 0 else self._stages[start - 1][1]
+            self.rendered_stages = 0
+
+            for i in range(start, len(chain)):
+                if progress is not None and not progress(i, len(chain)):
+                    return None
+                name, params = chain[i]
+                with span(f"effect {name}", stage=i):
+                    buf = check_audio(name, EFFECTS[name](**params)(buf, sample_rate))
+                self._stages.append((signatures[i], buf))
+                self.rendered_stages += 1
+                self._evict()
+
+            return buf
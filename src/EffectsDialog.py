@@ -1,6 +1,10 @@
-from PyQt6.QtWidgets import QDialog, QVBoxLayout, QLabel, QDoubleSpinBox, QSpinBox, QPushButton
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QLabel, QDoubleSpinBox, QSpinBox, QPushButton,
+    QFileDialog)
 
 class EffectOptionsDialog(QDialog):
+    # Parameter name -> attribute of its spin box
+    PARAMETERS = {}
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setLayout(QVBoxLayout())
@@ -11,7 +15,17 @@ class EffectOptionsDialog(QDialog):
     def get_parameters(self):
         return {}
 
+    def set_parameters(self, params):
+        """
+        Show the parameters of an effect already in the chain
+        """
+        for name, value in params.items():
+            if name in self.PARAMETERS:
+                getattr(self, self.PARAMETERS[name]).setValue(value)
+
 class CompressorOptionsDialog(EffectOptionsDialog):
+    PARAMETERS = {"threshold_db": "threshold", "ratio": "ratio"}
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Compressor Options")
@@ -33,6 +47,8 @@ class CompressorOptionsDialog(EffectOptionsDialog):
         }
 
 class ReverbOptionsDialog(EffectOptionsDialog):
+    PARAMETERS = {"room_size": "room_size"}
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Reverb Options")
@@ -46,6 +62,8 @@ class ReverbOptionsDialog(EffectOptionsDialog):
         return {"room_size": self.room_size.value()}
 
 class GainOptionsDialog(EffectOptionsDialog):
+    PARAMETERS = {"gain_db": "gain_db"}
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Gain Options")
@@ -59,6 +77,8 @@ class GainOptionsDialog(EffectOptionsDialog):
         return {"gain_db": self.gain_db.value()}
 
 class PitchShiftOptionsDialog(EffectOptionsDialog):
+    PARAMETERS = {"semitones": "semitones"}
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Pitch Shift Options")
@@ -72,6 +92,8 @@ class PitchShiftOptionsDialog(EffectOptionsDialog):
         return {"semitones": self.semitones.value()}
 
 class DelayOptionsDialog(EffectOptionsDialog):
+    PARAMETERS = {"delay_seconds": "delay_seconds"}
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Delay Options")
@@ -85,6 +107,8 @@ class DelayOptionsDialog(EffectOptionsDialog):
         return {"delay_seconds": self.delay_seconds.value()}
 
 class DistortionOptionsDialog(EffectOptionsDialog):
+    PARAMETERS = {"drive": "drive"}
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Distortion Options")
@@ -98,6 +122,8 @@ class DistortionOptionsDialog(EffectOptionsDialog):
         return {"drive": self.drive.value()}
 
 class FilterOptionsDialog(EffectOptionsDialog):
+    PARAMETERS = {"cutoff_frequency_hz": "cutoff"}
+
     def __init__(self, filter_type="Lowpass", parent=None):
         super().__init__(parent)
         self.setWindowTitle(f"{filter_type} Filter Options")
@@ -111,6 +137,8 @@ class FilterOptionsDialog(EffectOptionsDialog):
         return {"cutoff_frequency_hz": self.cutoff.value()}
 
 class ChorusOptionsDialog(EffectOptionsDialog):
+    PARAMETERS = {"rate_hz": "rate", "depth": "depth"}
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Chorus Options")
@@ -129,6 +157,8 @@ class ChorusOptionsDialog(EffectOptionsDialog):
         return {"rate_hz": self.rate.value(), "depth": self.depth.value()}
 
 class PhaserOptionsDialog(EffectOptionsDialog):
+    PARAMETERS = {"rate_hz": "rate", "depth": "depth"}
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Phaser Options")
@@ -147,6 +177,8 @@ class PhaserOptionsDialog(EffectOptionsDialog):
         return {"rate_hz": self.rate.value(), "depth": self.depth.value()}
 
 class LimiterOptionsDialog(EffectOptionsDialog):
+    PARAMETERS = {"threshold_db": "threshold"}
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Limiter Options")
@@ -160,6 +192,8 @@ class LimiterOptionsDialog(EffectOptionsDialog):
         return {"threshold_db": self.threshold.value()}
 
 class LadderFilterOptionsDialog(EffectOptionsDialog):
+    PARAMETERS = {"cutoff_hz": "cutoff", "resonance": "resonance"}
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Ladder Filter Options")
@@ -181,22 +215,37 @@ class ConvolutionOptionsDialog(EffectOptionsDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Convolution Options")
-        # For real use: add a file picker for impulse response file
-        self.layout().insertWidget(0, QLabel("No options (impulse loaded externally)."))
-
-    def get_parameters(self):
-        return {}
-
-class MixOptionsDialog(EffectOptionsDialog):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("Mix Options")
-        self.balance = QDoubleSpinBox()
-        self.balance.setRange(0.0, 1.0)
-        self.balance.setValue(0.5)
-        self.layout().insertWidget(0, QLabel("Balance (0 = dry, 1 = wet):"))
-        self.layout().insertWidget(1, self.balance)
+        self.impulse_response = ""
+        self.impulse_label = QLabel("No impulse response chosen")
+        self.browse_button = QPushButton("Impulse Response...")
+        self.browse_button.clicked.connect(self._browse)
+        self.mix = QDoubleSpinBox()
+        self.mix.setRange(0.0, 1.0)
+        self.mix.setValue(1.0)
+        self.layout().insertWidget(0, self.impulse_label)
+        self.layout().insertWidget(1, self.browse_button)
+        self.layout().insertWidget(2, QLabel("Mix:"))
+        self.layout().insertWidget(3, self.mix)
+        # Convolution cannot be built without an impulse response
+        self.ok_button.setEnabled(False)
+
+    def _browse(self):
+        filename, _ = QFileDialog.getOpenFileName(self, "Impulse Response",
+                                                  filter="Audio Files (*.wav *.flac *.aiff *.ogg *.mp3)")
+        if filename:
+            self._set_impulse_response(filename)
+
+    def _set_impulse_response(self, filename):
+        self.impulse_response = filename
+        self.impulse_label.setText(filename)
+        self.ok_button.setEnabled(True)
 
     def get_parameters(self):
-        return {"wet_level": self.balance.value()}
-
+        return {"impulse_response_filename": self.impulse_response,
+                "mix": self.mix.value()}
+
+    def set_parameters(self, params):
+        if "impulse_response_filename" in params:
+            self._set_impulse_response(params["impulse_response_filename"])
+        if "mix" in params:
+            self.mix.setValue(params["mix"])
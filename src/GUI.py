@@ -3,27 +3,38 @@ from PyQt6.QtWidgets import (QMainWindow, QWidget, QLabel,
     QHBoxLayout, QApplication, QGraphicsScene,
     QGraphicsPixmapItem, QGraphicsLineItem, QMenuBar,
     QGraphicsEllipseItem, QMenu, QFileDialog, QToolBar,
-    QComboBox, QLineEdit, QColorDialog)
+    QComboBox, QLineEdit, QColorDialog, QProgressBar, QInputDialog)
 from GraphicsView import GraphicsView
 from PyQt6.QtGui import QPixmap, QPen, QKeySequence, QShortcut, QImage, QColor, QAction
 from PyQt6.QtCore import QTimer, Qt, pyqtSignal, QThreadPool
 import sys
 import numpy as np
-import cv2
-import time
-import soundfile as sf
 import os
+import tempfile
 from pedalboard import (Pedalboard, Compressor, Reverb, Phaser, PitchShift,
-    Delay, Distortion, Chorus, Limiter, LadderFilter, Mix, Convolution)
-from typing import Dict
+    Delay, Distortion, Chorus, Limiter, LadderFilter, Convolution, Gain)
+from typing import Dict, List
 
 from visound.core.TraversalMode import TraversalMode
-from visound.core.sonify import Sonify
 
 from DimensionBox import DimensionDialog
 from AudioController import AudioController
+from AudioExport import EXPORT_FORMATS, apply_effects, array_blocks, export_audio
+from AudioHealthDialog import AudioHealthDialog
+from Renderer import SYNTHESIS_ENGINES, TRAVERSAL_MODES
+from SonifyWorker import SonifyWorker, StreamWorker, TaskWorker
+from Synthesis import max_radius, playhead_center
+from Tracing import TRACER, span
+from AudioCache import AudioCache
+from ImageLoader import LoadStats, load_image
+from Playlist import Playlist
+from EffectChain import (EFFECTS, EffectChainRenderer, build_pedalboard,
+                         load_preset, preset_dir, render_variants, save_preset)
 from EffectsDialog import *
 from ScreenRecordDialog import ScreenRecordDialog
+from VideoEncoder import VideoEncoder
+from VideoExport import export_video
+from VideoSonify import VideoPipeline
 
 
 class MainWindow(QMainWindow):
@@ -35,24 +46,64 @@ class MainWindow(QMainWindow):
         self._playable = False
         self._playing = False
         self._paused = False
-        self._start_time = 0
+        # Audio position in seconds the drawn bar or circle stands for
+        self._bar_time = 0.0
+        self._av_drift = 0.0
         self._traversal_mode = None
         self._pixmap: QPixmap = None
         self._pixmap_item: QGraphicsPixmapItem = None
+        self._image: np.ndarray = None
+        self._load_stats: LoadStats = None
         self._dpc: float = None
         self._bar_x = 0
         self._bar_y = 0
+        self._center = (0, 0)
+        self._max_radius = 0
+        # Trace position where the last traced run started
+        self._trace_mark = 0
         self._FPS = 60
         self._audio = None
+        self._sample_rate = None
         self._audio_controller = AudioController()
         self._pedalboard = Pedalboard()
-        self._active_effects = {}
-        self._capture_dir = None
-        self._capture_index = 0
-        self.sonify_obj = None
+        self._effect_chain = []
+        # (name, audio) of the rendered preset variants, the first one is
+        # the audio they were rendered next to
+        self._variants = []
+        self._live_effects = False
+        self._streamed = False
+        self._stream_prebuffer = 2.0
+        self._dry_audio = None
+        self._source_key = None
+        self._chain_renderer = EffectChainRenderer()
+        self._capture_path = None
+        self._capture_audio_path = None
+        self._video_encoder: VideoEncoder = None
+        self._thread_pool = QThreadPool()
+        self._sonify_worker: SonifyWorker = None
+        self._sonify_job_id = 0
+        self._export_worker: TaskWorker = None
+        # Live mode: parameter edits re-sonify once they settle for this long
+        self._live_delay_ms = 300
+        self._live_timer = QTimer()
+        self._live_timer.setSingleShot(True)
+        self._live_timer.setInterval(self._live_delay_ms)
+        self._live_timer.timeout.connect(self._live_sonify)
+        # Start playing when the running sonification finishes
+        self._play_when_ready = False
+        self._audio_cache = AudioCache()
+        self._playlist: Playlist = None
+        self._video: VideoPipeline = None
+        # Index of the video frame shown and the sweep position it was at
+        self._video_frame = -1
+        self._video_sweep = 0.0
+        self._playlist_prefetch = 2
+        # AudioController.track the shown playlist item was played as
+        self._playlist_track = 0
 
         self._layout = QVBoxLayout()
         self._graphics_view = GraphicsView()
+        self._graphics_view.painted.connect(self._view_painted)
         self._graphics_scene = QGraphicsScene(self._graphics_view)
         self._layout.addWidget(self._graphics_view)
         widget = QWidget()
@@ -73,6 +124,7 @@ class MainWindow(QMainWindow):
 
         self._init_toolbar()
         self._init_menubar()
+        self._init_statusbar()
         self._handle_keybindings()
         self.show()
 
@@ -109,18 +161,55 @@ class MainWindow(QMainWindow):
         sc_pause_resume = QShortcut(QKeySequence("space"), self)
         sc_pause_resume.activated.connect(self._pause_resume_requested)
 
+        sc_seek_back = QShortcut(QKeySequence("left"), self)
+        sc_seek_back.activated.connect(lambda: self._seek_requested(-1.0))
+
+        sc_seek_forward = QShortcut(QKeySequence("right"), self)
+        sc_seek_forward.activated.connect(lambda: self._seek_requested(1.0))
+
     def _pause_resume_requested(self):
+        if not self._playable:
+            return
+
         self._playing = not self._playing
 
         if self._playing:
-            self._start_time = time.perf_counter()
             self._timer.start()
             self._audio_controller.resume()
         else:
             self._audio_controller.pause()
             self._timer.stop()
 
+    def _seek_requested(self, delta: float):
+        """
+        Move the playback by `delta` seconds and the bar with it
+        """
+        if not self._playable:
+            return
+
+        self._audio_controller.seek(self._audio_controller.position() + delta)
+        self.init_bar_position()
+        self._advance_bar()
+
+    @property
+    def av_drift(self) -> float:
+        """
+        Seconds the audio being heard was ahead of the drawn bar or circle
+        the last time the view was painted during playback. Counts the
+        rounding of the bar to whole columns and the time from placing the
+        bar to painting it.
+        """
+        return self._av_drift
+
+    def _view_painted(self) -> None:
+        if self._playing and self._audio_controller.playing:
+            self._av_drift = self._audio_controller.position() - self._bar_time
+            self._drift_label.setText(f"A/V drift: {self._av_drift * 1000:.1f} ms")
+
     def _reset_requested(self):
+        if not self._playable or self._video is not None:
+            return
+
         self._playing = False
         self._audio_controller.reset()
         self.bar_reset()
@@ -130,17 +219,22 @@ class MainWindow(QMainWindow):
         """
         Load the image to the GUI
         """
-        self._graphics_scene.removeItem(self._pixmap_item)
-        bytes_per_line = 3 * self._width
-        img_rgb = cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB)
-        qimg = QImage(img_rgb.data, self._width, self._height,
-                      bytes_per_line, QImage.Format.Format_RGB888)
+        with span("loadImage"):
+            self._graphics_scene.removeItem(self._pixmap_item)
+            self._image = img_cv
+            # Fixed for the image, used by the circle traversals every frame
+            self._center = playhead_center((self._height, self._width))
+            self._max_radius = max_radius((self._height, self._width))
+            # The grayscale array backs the QImage directly, the pixmap copies it
+            qimg = QImage(img_cv.data, self._width, self._height,
+                          img_cv.strides[0], QImage.Format.Format_Grayscale8)
+
+            self._pixmap = QPixmap.fromImage(qimg)
+            self._pixmap_item = QGraphicsPixmapItem(self._pixmap)
+            self._graphics_scene.addItem(self._pixmap_item)
+            self._graphics_view.setScene(self._graphics_scene)
+            self._bar.setZValue(1)
 
-        self._pixmap = QPixmap.fromImage(qimg)
-        self._pixmap_item = QGraphicsPixmapItem(self._pixmap)
-        self._graphics_scene.addItem(self._pixmap_item)
-        self._graphics_view.setScene(self._graphics_scene)
-        self._bar.setZValue(1)
 
     def init_bar_position(self):
         """
@@ -156,8 +250,8 @@ class MainWindow(QMainWindow):
                 self._graphics_scene.addItem(self._bar)
 
             case TraversalMode.RightToLeft:
-                self._bar_x = self.width
-                self._bar.setLine(self._bar_x, 0, self._bar_x, self.height)
+                self._bar_x = self._width
+                self._bar.setLine(self._bar_x, 0, self._bar_x, self._height)
                 self._graphics_scene.removeItem(self._circle)
                 self._graphics_scene.addItem(self._bar)
 
@@ -174,19 +268,15 @@ class MainWindow(QMainWindow):
                 self._graphics_scene.addItem(self._bar)
 
             case TraversalMode.CircleInward:
-                self._center = (self._width // 2, self._height // 2)
-                self._max_radius = int(np.hypot(self._center[0], self._center[1]))
                 self._circle.setRect(
-                    self._center[1] - self._max_radius,
                     self._center[0] - self._max_radius,
+                    self._center[1] - self._max_radius,
                     2 * self._max_radius,
                     2 * self._max_radius)
                 self._graphics_scene.removeItem(self._bar)
                 self._graphics_scene.addItem(self._circle)
 
             case TraversalMode.CircleOutward:
-                self._center = (self._width // 2, self._height // 2)
-                self._max_radius = int(np.hypot(self._center[0], self._center[1]))
                 self._graphics_scene.removeItem(self._bar)
                 self._graphics_scene.addItem(self._circle)
 
@@ -194,66 +284,310 @@ class MainWindow(QMainWindow):
         """
         Advance the bar every frame in sync with the audio
         """
-        elapsed = time.perf_counter() - self._start_time
+        if self._playlist is not None:
+            self._poll_playlist()
+        if self._video is not None:
+            self._poll_video()
+            if self._video is None:
+                return
+
+        audio_position = position = self._audio_controller.position()
+        if self._video is not None:
+            # The traversal wraps around while the video plays, and skips
+            # ahead over dropped frames
+            position = self._video.sweep_position(int(position * self._sample_rate))
+            if position < self._video_sweep:
+                self.init_bar_position()
+            self._video_sweep = position
+
+        # Columns, rows or rings the audio has gone through
+        steps = int(position / self._dpc)
+        self._bar_time = audio_position - (position - steps * self._dpc)
+
         match self._traversal_mode:
 
             case TraversalMode.LeftToRight:
                 if self._bar_x < self._pixmap.width():
-                    self._bar_x = int(elapsed / self._dpc)
+                    self._bar_x = steps
                     self._bar.setLine(self._bar_x, 0, self._bar_x, self._height)
                 else:
-                    self._playing = False
-                    self._timer.stop()
+                    self._bar_finished()
 
             case TraversalMode.RightToLeft:
                 if self._bar_x > 0:
-                    self._bar_x = self._width - int(elapsed / self._dpc)
+                    self._bar_x = self._width - steps
                     self._bar.setLine(self._bar_x, 0, self._bar_x, self._height)
                 else:
-                    self._playing = False
-                    self._timer.stop()
+                    self._bar_finished()
 
             case TraversalMode.TopToBottom:
                 if self._bar_y < self._height:
-                    self._bar_y = int(elapsed / self._dpc)
+                    self._bar_y = steps
                     self._bar.setLine(0, self._bar_y, self._width, self._bar_y)
                 else:
-                    self._playing = False
-                    self._timer.stop()
+                    self._bar_finished()
 
             case TraversalMode.BottomToTop:
                 if self._bar_y >= 0:
-                    self._bar_y = self._height - int(elapsed / self._dpc)
+                    self._bar_y = self._height - steps
                     self._bar.setLine(0, self._bar_y, self._width, self._bar_y)
                 else:
-                    self._playing = False
-                    self._timer.stop()
+                    self._bar_finished()
 
             case TraversalMode.CircleInward:
-                self._radius = self._max_radius - int(elapsed / self._dpc)
+                self._radius = self._max_radius - steps
 
                 if self._radius > 0:
                     self._circle.setRect(
-                        self._center[1] - self._radius,
                         self._center[0] - self._radius,
+                        self._center[1] - self._radius,
                         2 * self._radius,
                         2 * self._radius)
                 else:
-                    self._playing = False
-                    self._timer.stop()
+                    self._bar_finished()
 
             case TraversalMode.CircleOutward:
-                self._radius = int(elapsed / self._dpc)
+                self._radius = steps
 
                 if self._radius < self._max_radius:
                     self._circle.setRect(
-                        self._center[1] - self._radius,
                         self._center[0] - self._radius,
+                        self._center[1] - self._radius,
                         2 * self._radius,
                         2 * self._radius)
                 else:
-                    self._playing = False
-                    self._timer.stop()
+                    self._bar_finished()
+
+    def _bar_finished(self) -> None:
+        """
+        The bar went through the image. In a playlist with more to play
+        the timer keeps running to follow the audio into the next image.
+        """
+        if self._playlist is not None and self._playlist.next_index() is not None:
+            return
+        if self._video is not None:
+            return
+        self._playing = False
+        self._timer.stop()
+
+    def _open_playlist(self) -> None:
+        """
+        Play several images one after another, rendering the next ones in
+        the background while the current one plays
+        """
+        filenames, _ = QFileDialog.getOpenFileNames(self,
+                                                    filter="Image Files (*.png *.jpg *.jpeg *.bmp *.gif *.tif *.tiff)")
+        if not filenames:
+            return
+        db = DimensionDialog()
+        if not db.exec():
+            return
+        self._width, self._height = db.get_dimensions()
+        self._dimension = (self._height, self._width)
+
+        self._cancel_sonify()
+        self._stop_playback()
+        self._stop_playlist()
+        self._stop_video()
+        self._clear_variants()
+        self._playable = False
+        self.action__play.setEnabled(self._playable)
+
+        self._playlist = Playlist(filenames, self._dimension,
+                                  float(self.action__dpc.text()),
+                                  int(self.action__samplerate.text()),
+                                  TRAVERSAL_MODES[self.action__traversal.currentIndex()],
+                                  SYNTHESIS_ENGINES[self.action__engine.currentIndex()],
+                                  [] if self._live_effects else list(self._effect_chain),
+                                  self._thread_pool, self._audio_cache,
+                                  self._playlist_prefetch)
+        self._playlist.ready.connect(self._playlist_item_ready)
+        self._playlist.failed.connect(self._playlist_item_failed)
+        self.statusBar().showMessage(f"Playlist: rendering {self._playlist.name(0)}")
+        self._playlist.prefetch()
+
+    def _stop_playlist(self) -> None:
+        if self._playlist is not None:
+            self._playlist.stop()
+            self._playlist = None
+
+    def _playlist_item_ready(self, index: int) -> None:
+        if index == self._playlist.current and not self._playable:
+            self._play_playlist_item()
+        self._poll_playlist()
+
+    def _playlist_item_failed(self, index: int, message: str) -> None:
+        self.statusBar().showMessage(f"Skipped {self._playlist.name(index)}: {message}", 10000)
+        if index == self._playlist.current and not self._playable:
+            # Nothing played yet, start from the next image instead
+            if not self._playlist.advance():
+                self._stop_playlist()
+                QMessageBox.critical(self, "Playlist failed", message)
+            elif self._playlist.item(self._playlist.current) is not None:
+                # Rendered ahead already, its ready signal has gone
+                self._play_playlist_item()
+
+    def _play_playlist_item(self) -> None:
+        """
+        Start playing the current playlist item from its beginning
+        """
+        playlist = self._playlist
+        self._sample_rate = playlist.sample_rate
+        self._dpc = playlist.dpc
+        self._traversal_mode = playlist.mode
+        self._streamed = False
+        self._show_playlist_item()
+        self._playable = True
+        self.action__play.setEnabled(self._playable)
+
+        with span("set_params"):
+            self._audio_controller.set_params(self._audio, self._sample_rate)
+            self._update_live_effects()
+        self._playlist_track = self._audio_controller.track
+        self._playing = False
+        self._pause_resume_requested()
+
+    def _show_playlist_item(self) -> None:
+        """
+        Show the image of the current playlist item and take its audio
+        """
+        playlist = self._playlist
+        image, audio = playlist.item(playlist.current)
+        self._filename = playlist.paths[playlist.current]
+        self._source_key = playlist.source_key(playlist.current)
+        self._audio = audio
+        # Rendered with the effects unless they are live
+        self._dry_audio = None if playlist.chain else audio
+        self.loadImage(image)
+        self.init_bar_position()
+        self.statusBar().showMessage(f"Playlist {playlist.current + 1}/{len(playlist)}: "
+                                     f"{playlist.name(playlist.current)}")
+
+    def _poll_playlist(self) -> None:
+        """
+        Follow the audio controller through the playlist: show the image it
+        moved on to, queue the next rendered one, or start that one if
+        playback ran out before it was rendered
+        """
+        playlist = self._playlist
+        controller = self._audio_controller
+        if controller.track != self._playlist_track:
+            self._playlist_track = controller.track
+            playlist.advance()
+            self._show_playlist_item()
+
+        index = playlist.next_index()
+        item = playlist.item(index) if index is not None else None
+        if item is None or not self._playable:
+            return
+
+        if not controller.playing and controller.position() >= controller.duration():
+            playlist.advance()
+            self._play_playlist_item()
+        elif not controller.queued:
+            controller.queue_next(item[1])
+
+    def _set_playlist_prefetch(self) -> None:
+        depth, ok = QInputDialog.getInt(self, "Playlist Prefetch",
+                                        "Images to render ahead:",
+                                        self._playlist_prefetch, 0, 16)
+        if ok:
+            self._playlist_prefetch = depth
+            if self._playlist is not None:
+                self._playlist.prefetch_depth = depth
+                self._playlist.prefetch()
+
+    def _open_video(self) -> None:
+        """
+        Sonify a video frame by frame while it plays, with the toolbar
+        traversal, DPC and sample rate. The traversal keeps sweeping over
+        the frames as they change.
+        """
+        filename, _ = QFileDialog.getOpenFileName(self,
+                                                  filter="Video Files (*.mp4 *.mkv *.mov *.avi *.webm)")
+        if filename == "":
+            return
+        db = DimensionDialog()
+        if not db.exec():
+            return
+        self._width, self._height = db.get_dimensions()
+        self._dimension = (self._height, self._width)
+
+        self._cancel_sonify()
+        self._stop_playback()
+        self._stop_playlist()
+        self._stop_video()
+        self._clear_variants()
+
+        try:
+            self._video = VideoPipeline(filename, self._dimension,
+                                        float(self.action__dpc.text()),
+                                        int(self.action__samplerate.text()),
+                                        TRAVERSAL_MODES[self.action__traversal.currentIndex()],
+                                        None if self._live_effects else
+                                        build_pedalboard(self._effect_chain))
+        except ValueError as e:
+            QMessageBox.critical(self, "Could not open video", str(e))
+            return
+
+        video = self._video
+        self._filename = filename
+        self._dpc = video.dpc
+        self._sample_rate = video.sample_rate
+        self._traversal_mode = video.mode
+        self._streamed = True
+        self._video_frame = -1
+        self._video_sweep = 0.0
+        self.loadImage(np.zeros(self._dimension, dtype=np.uint8))
+        self.init_bar_position()
+
+        self._audio_controller.set_ring(video.ring, video.sample_rate)
+        self._update_live_effects()
+        self._audio = None
+        self._dry_audio = None
+        video.start()
+        # The timer waits for the first audio, then follows the playback
+        self._timer.start()
+        self.statusBar().showMessage(f"Video: {os.path.basename(filename)}, "
+                                     f"{video.fps:.2f} fps")
+
+    def _poll_video(self) -> None:
+        """
+        Start playing once the first audio is buffered, show the frame
+        being heard and stop at the end of the video
+        """
+        video = self._video
+        controller = self._audio_controller
+        if not self._playable and video.ready:
+            self._playable = True
+            self.action__play.setEnabled(self._playable)
+            self._playing = False
+            self._pause_resume_requested()
+
+        shown = video.frame_at(controller.current_frame)
+        if shown is not None and shown[0] != self._video_frame:
+            self._video_frame = shown[0]
+            self.loadImage(shown[1])
+        self.statusBar().showMessage(f"Video frame {self._video_frame}: "
+                                     f"{video.stats.summary()}")
+
+        if video.finished and self._playable and not controller.playing and self._playing:
+            message = video.error or f"Video done: {video.stats.summary()}"
+            self._stop_video()
+            self.statusBar().showMessage(message, 10000)
+
+    def _stop_video(self) -> None:
+        if self._video is not None:
+            self._video.stop()
+            self._video = None
+            # The last frame stays on screen but is not an image to sonify
+            self._image = None
+            self._pixmap = None
+            self._playing = False
+            self._playable = False
+            self.action__play.setEnabled(self._playable)
+            self._timer.stop()
+            self._audio_controller.pause()
 
     def _gui_open_image(self) -> bool:
         """
@@ -263,13 +597,20 @@ class MainWindow(QMainWindow):
         self._filename, _ = QFileDialog.getOpenFileName(self,
                                                         filter="Image Files (*.png *.jpg *.jpeg *.bmp *.gif *.tif *.tiff)")
         if self._filename != "":
+            self._stop_playlist()
+            self._stop_video()
             db = DimensionDialog()
             if db.exec():
                 self._width, self._height = db.get_dimensions()
                 self._dimension = (self._height, self._width)
-            img = cv2.imread(self._filename, cv2.IMREAD_GRAYSCALE)
-            img = cv2.resize(img, (self._width, self._height))
-            self.loadImage(img_cv=img)
+            self._trace_mark = TRACER.mark()
+            self._load_stats = LoadStats()
+            with span("open image", file=os.path.basename(self._filename)):
+                img = load_image(self._filename, self._dimension, self._load_stats)
+                self.loadImage(img_cv=img)
+            self.statusBar().showMessage(f"Loaded {os.path.basename(self._filename)}: "
+                                         f"{self._load_stats.summary()}", 10000)
+            self._show_trace()
             return True
 
         return False
@@ -287,10 +628,22 @@ class MainWindow(QMainWindow):
         self.menu__file.addAction(self.menu__file__open)
         self.menu__file__open.triggered.connect(self._gui_open_image)
 
+        self.menu__file__open_playlist = QAction("Open Playlist")
+        self.menu__file.addAction(self.menu__file__open_playlist)
+        self.menu__file__open_playlist.triggered.connect(self._open_playlist)
+
+        self.menu__file__open_video = QAction("Open Video")
+        self.menu__file.addAction(self.menu__file__open_video)
+        self.menu__file__open_video.triggered.connect(self._open_video)
+
         self.menu__file__save_audio = QAction("Save Audio")
         self.menu__file.addAction(self.menu__file__save_audio)
         self.menu__file__save_audio.triggered.connect(self._save_audio)
 
+        self.menu__file__export_video = QAction("Export Video")
+        self.menu__file.addAction(self.menu__file__export_video)
+        self.menu__file__export_video.triggered.connect(self._export_video)
+
         self.menu__file__exit = QAction("Exit")
         self.menu__file.addAction(self.menu__file__exit)
         self.menu__file__exit.triggered.connect(lambda: QApplication.exit())
@@ -338,9 +691,30 @@ class MainWindow(QMainWindow):
         self.effects__convolution = QAction("Convolution")
         self.effects__convolution.setCheckable(True)
 
-        self.effects__mix = QAction("Mix")
-        self.effects__mix.setCheckable(True)
-
+        self.effects__live = QAction("Live Effects")
+        self.effects__live.setCheckable(True)
+        self.effects__live.setChecked(self._live_effects)
+
+        self.effects__clear = QAction("Clear Effects")
+        self.effects__insert = QAction("Insert Effect")
+        self.effects__edit = QAction("Edit Effect")
+        self.effects__remove = QAction("Remove Effect")
+
+        self.effects__save_preset = QAction("Save Preset")
+        self.effects__load_preset = QAction("Load Preset")
+        self.effects__render_variants = QAction("Render Variants")
+        self.effects__render_variants.setToolTip("Apply several presets to the "
+                                                 "sonified audio to compare them")
+
+        self.menu__edit__effects.addAction(self.effects__live)
+        self.menu__edit__effects.addAction(self.effects__clear)
+        self.menu__edit__effects.addAction(self.effects__insert)
+        self.menu__edit__effects.addAction(self.effects__edit)
+        self.menu__edit__effects.addAction(self.effects__remove)
+        self.menu__edit__effects.addAction(self.effects__save_preset)
+        self.menu__edit__effects.addAction(self.effects__load_preset)
+        self.menu__edit__effects.addAction(self.effects__render_variants)
+        self.menu__edit__effects.addSeparator()
         self.menu__edit__effects.addAction(self.effects__compressor)
         self.menu__edit__effects.addAction(self.effects__reverb)
         self.menu__edit__effects.addAction(self.effects__phaser)
@@ -354,7 +728,6 @@ class MainWindow(QMainWindow):
         self.menu__edit__effects.addAction(self.effects__limiter)
         self.menu__edit__effects.addAction(self.effects__pitchshift)
         self.menu__edit__effects.addAction(self.effects__convolution)
-        self.menu__edit__effects.addAction(self.effects__mix)
 
         self._setup_effect_actions()
 
@@ -375,6 +748,32 @@ class MainWindow(QMainWindow):
         self.menu__tools.addAction(self.action__screenrecord)
         self.action__screenrecord.triggered.connect(self._screen_record)
 
+        self.action__audio_health = QAction("Audio Health")
+        self.action__audio_health.triggered.connect(self._show_audio_health)
+        self.menu__tools.addAction(self.action__audio_health)
+
+        self.action__playlist_prefetch = QAction("Playlist Prefetch")
+        self.action__playlist_prefetch.setToolTip("How many images of a playlist "
+                                                  "to render ahead")
+        self.action__playlist_prefetch.triggered.connect(self._set_playlist_prefetch)
+        self.menu__tools.addAction(self.action__playlist_prefetch)
+
+        self.menu__tools.addSeparator()
+
+        self.action__tracing = QAction("Tracing")
+        self.action__tracing.setCheckable(True)
+        self.action__tracing.setChecked(TRACER.enabled)
+        self.action__tracing.triggered.connect(self._toggle_tracing)
+        self.menu__tools.addAction(self.action__tracing)
+
+        self.action__export_trace = QAction("Export Trace")
+        self.action__export_trace.triggered.connect(self._export_trace)
+        self.menu__tools.addAction(self.action__export_trace)
+
+        self.action__clear_trace = QAction("Clear Trace")
+        self.action__clear_trace.triggered.connect(self._clear_trace)
+        self.menu__tools.addAction(self.action__clear_trace)
+
 
         self.menubar.addMenu(self.menu__file)
         self.menubar.addMenu(self.menu__edit)
@@ -385,6 +784,14 @@ class MainWindow(QMainWindow):
 
     def _setup_effect_actions(self):
         # Wire actions to effect methods
+        self.effects__live.triggered.connect(self._toggle_live_effects)
+        self.effects__clear.triggered.connect(self._clear_effects)
+        self.effects__insert.triggered.connect(self._insert_effect)
+        self.effects__edit.triggered.connect(self._edit_effect)
+        self.effects__remove.triggered.connect(self._remove_effect)
+        self.effects__save_preset.triggered.connect(self._save_preset)
+        self.effects__load_preset.triggered.connect(self._load_preset)
+        self.effects__render_variants.triggered.connect(self._render_variants)
         self.effects__compressor.triggered.connect(self._add_compressor)
         self.effects__reverb.triggered.connect(self._add_reverb)
         self.effects__gain.triggered.connect(self._add_gain)
@@ -395,14 +802,278 @@ class MainWindow(QMainWindow):
         self.effects__limiter.triggered.connect(self._add_limiter)
         self.effects__ladder.triggered.connect(self._add_ladder_filter)
         self.effects__convolution.triggered.connect(self._add_convolution)
-        self.effects__mix.triggered.connect(self._add_mix)
+
+    def _append_effect(self, name: str, effect, params: Dict) -> None:
+        """
+        Append an effect to the pedalboard and to the chain description
+        used for the staged rendering
+        """
+        self._pedalboard.append(effect)
+        self._effect_chain.append((name, params))
+        self._update_live_effects()
+
+    def _update_live_effects(self) -> None:
+        """
+        Hand the current chain to the audio controller when the effects
+        are applied during playback
+        """
+        if self._effects_in_playback():
+            # A new board sharing the plugins, so the ones already
+            # playing keep their state
+            self._audio_controller.set_effects(Pedalboard(list(self._pedalboard)))
+        else:
+            self._audio_controller.set_effects(None)
+
+    def _effects_in_playback(self) -> bool:
+        """
+        Whether the effects are applied by the audio controller rather
+        than rendered into the audio. A preset variant has its effects
+        rendered in. A video pipeline renders them into each frame's audio
+        unless they were live when the video was opened.
+        """
+        if self._video is not None:
+            return self._video.pedalboard is None
+        return (self._live_effects or self._streamed) and not self._variant_selected()
+
+    def _variant_selected(self) -> bool:
+        return self.action__variant.currentIndex() > 0
+
+    def _save_preset(self) -> None:
+        """
+        Save the effect chain as a preset
+        """
+        if not self._effect_chain:
+            QMessageBox.warning(self, "No effects", "Add some effects to save as a preset.")
+            return
+
+        os.makedirs(preset_dir(), exist_ok=True)
+        filename, _ = QFileDialog.getSaveFileName(self, directory=preset_dir(),
+                                                  filter="Effect Presets (*.json)")
+        if filename != "":
+            if not filename.endswith(".json"):
+                filename += ".json"
+            save_preset(filename, self._effect_chain)
+
+    def _load_preset(self) -> None:
+        """
+        Replace the effect chain with a preset
+        """
+        filename, _ = QFileDialog.getOpenFileName(self, directory=preset_dir(),
+                                                  filter="Effect Presets (*.json)")
+        if filename == "":
+            return
+        try:
+            chain = load_preset(filename)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Could not load preset", str(e))
+            return
+
+        self._set_effect_chain(chain)
+
+    def _set_effect_chain(self, chain: List) -> None:
+        """
+        Replace the effect chain and bring the audio up to date. Rendered
+        effects are run again from the first stage that changed. A chain
+        that cannot be built is reported and the old one kept.
+        """
+        try:
+            self._pedalboard = build_pedalboard(chain)
+        except (TypeError, ValueError, RuntimeError) as e:
+            QMessageBox.critical(self, "Invalid effect", str(e))
+            return
+        self._effect_chain = chain
+        if self._effects_in_playback():
+            self._update_live_effects()
+        elif self._dry_audio is not None:
+            self._helper_sonify()
+
+    def _choose_effect(self, title: str) -> int:
+        """
+        Let the user pick an effect of the chain, returns its index or -1
+        """
+        if not self._effect_chain:
+            QMessageBox.warning(self, "No effects", "The effect chain is empty.")
+            return -1
+        items = [f"{i + 1}. {name} "
+                 + ", ".join(f"{key}={value}" for key, value in params.items())
+                 for i, (name, params) in enumerate(self._effect_chain)]
+        item, ok = QInputDialog.getItem(self, title, "Effect:", items, 0, False)
+        return items.index(item) if ok else -1
+
+    def _effect_dialog(self, name: str, params: Dict = None):
+        """
+        Options dialog of an effect, showing `params` if given
+        """
+        dialogs = {
+            "compressor": CompressorOptionsDialog,
+            "reverb": ReverbOptionsDialog,
+            "gain": GainOptionsDialog,
+            "pitchshift": PitchShiftOptionsDialog,
+            "delay": DelayOptionsDialog,
+            "distortion": DistortionOptionsDialog,
+            "chorus": ChorusOptionsDialog,
+            "phaser": PhaserOptionsDialog,
+            "limiter": LimiterOptionsDialog,
+            "ladder": LadderFilterOptionsDialog,
+            "highpass": lambda parent: FilterOptionsDialog("Highpass", parent),
+            "lowpass": lambda parent: FilterOptionsDialog("Lowpass", parent),
+            "convolution": ConvolutionOptionsDialog,
+        }
+        dialog = dialogs[name](self)
+        if params:
+            dialog.set_parameters(params)
+        return dialog
+
+    def _insert_effect(self) -> None:
+        """
+        Insert an effect at a position of the chain
+        """
+        name, ok = QInputDialog.getItem(self, "Insert Effect", "Effect:",
+                                        list(EFFECTS), 0, False)
+        if not ok:
+            return
+        position, ok = QInputDialog.getInt(self, "Insert Effect", "Position:",
+                                           len(self._effect_chain) + 1, 1,
+                                           len(self._effect_chain) + 1)
+        if not ok:
+            return
+        dialog = self._effect_dialog(name)
+        if dialog.exec():
+            chain = list(self._effect_chain)
+            chain.insert(position - 1, (name, dialog.get_parameters()))
+            self._set_effect_chain(chain)
+
+    def _edit_effect(self) -> None:
+        """
+        Change the parameters of an effect in the chain
+        """
+        index = self._choose_effect("Edit Effect")
+        if index < 0:
+            return
+        name, params = self._effect_chain[index]
+        dialog = self._effect_dialog(name, params)
+        if dialog.exec():
+            chain = list(self._effect_chain)
+            chain[index] = (name, dialog.get_parameters())
+            self._set_effect_chain(chain)
+
+    def _remove_effect(self) -> None:
+        """
+        Remove an effect from the chain
+        """
+        index = self._choose_effect("Remove Effect")
+        if index >= 0:
+            self._set_effect_chain(self._effect_chain[:index] + self._effect_chain[index + 1:])
+
+    def _render_variants(self) -> None:
+        """
+        Apply several presets to the sonified audio in parallel, to switch
+        between during playback
+        """
+        if self._dry_audio is None or self._sonify_worker is not None:
+            QMessageBox.warning(self, "No audio",
+                                "Sonify the image first, then render the variants.")
+            return
+
+        filenames, _ = QFileDialog.getOpenFileNames(self, directory=preset_dir(),
+                                                    filter="Effect Presets (*.json)")
+        if not filenames:
+            return
+        try:
+            chains = [load_preset(filename) for filename in filenames]
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Could not load preset", str(e))
+            return
+
+        names = [os.path.splitext(os.path.basename(f))[0] for f in filenames]
+        job_id = self._sonify_job_id
+        worker = TaskWorker(render_variants, self._dry_audio, self._sample_rate, chains)
+        worker.signals.progress.connect(self._progress_bar.setValue)
+        worker.signals.finished.connect(
+            lambda audios: self._variants_rendered(job_id, names, audios))
+        worker.signals.failed.connect(self._variants_failed)
+
+        self._progress_bar.setValue(0)
+        self._progress_bar.setVisible(True)
+        self.statusBar().showMessage(f"Rendering {len(chains)} variants")
+        self._thread_pool.start(worker)
+
+    def _variants_rendered(self, job_id: int, names: List[str],
+                           audios: List[np.ndarray]) -> None:
+        self._progress_bar.setVisible(False)
+        # Sonified again while rendering, the variants are of stale audio
+        if job_id != self._sonify_job_id:
+            self.statusBar().clearMessage()
+            return
+
+        self._clear_variants()
+        self._variants = [("Current", self._audio)] + list(zip(names, audios))
+        self.action__variant.blockSignals(True)
+        self.action__variant.addItems([name for name, _ in self._variants])
+        self.action__variant.blockSignals(False)
+        for action in self._variant_actions:
+            action.setVisible(True)
+        self.statusBar().showMessage(f"Rendered {len(audios)} variants", 5000)
+
+    def _variants_failed(self, message: str) -> None:
+        self._progress_bar.setVisible(False)
+        self.statusBar().clearMessage()
+        QMessageBox.critical(self, "Rendering variants failed", message)
+
+    def _select_variant(self, index: int) -> None:
+        """
+        Play another variant from the same position
+        """
+        if index < 0 or index >= len(self._variants):
+            return
+        self._audio = self._variants[index][1]
+        self._audio_controller.set_audio(self._audio)
+        self._update_live_effects()
+
+    def _clear_variants(self) -> None:
+        """
+        Drop the variants, they belong to audio that is being replaced
+        """
+        self._variants = []
+        self.action__variant.blockSignals(True)
+        self.action__variant.clear()
+        self.action__variant.blockSignals(False)
+        for action in self._variant_actions:
+            action.setVisible(False)
+
+    def _toggle_live_effects(self, live: bool) -> None:
+        """
+        Switch between applying the effects during playback and baking
+        them into the audio
+        """
+        self._live_effects = live
+
+        if self._dry_audio is None:
+            return
+
+        self._clear_variants()
+        if live:
+            self._audio = self._dry_audio
+            self._audio_controller.set_audio(self._audio)
+            self._update_live_effects()
+        else:
+            self._update_live_effects()
+            self._helper_sonify()
+
+    def _clear_effects(self) -> None:
+        """
+        Remove all the effects
+        """
+        self._pedalboard = Pedalboard()
+        self._effect_chain = []
+        self._update_live_effects()
 
     def _add_compressor(self, is_active: bool):
         dialog = CompressorOptionsDialog(self)
         if dialog.exec():
             params = dialog.get_parameters()
             effect = Compressor(**params)
-            self._pedalboard.append(effect)
+            self._append_effect("compressor", effect, params)
             print("Added Compressor with:", params)
 
     def _add_reverb(self):
@@ -410,7 +1081,7 @@ class MainWindow(QMainWindow):
         if dialog.exec():
             params = dialog.get_parameters()
             effect = Reverb(**params)
-            self._pedalboard.append(effect)
+            self._append_effect("reverb", effect, params)
             print("Added Reverb with:", params)
 
     def _add_gain(self):
@@ -418,7 +1089,7 @@ class MainWindow(QMainWindow):
         if dialog.exec():
             params = dialog.get_parameters()
             effect = Gain(**params)
-            self._pedalboard.append(effect)
+            self._append_effect("gain", effect, params)
             print("Added Gain with:", params)
 
     def _add_pitchshift(self):
@@ -426,7 +1097,7 @@ class MainWindow(QMainWindow):
         if dialog.exec():
             params = dialog.get_parameters()
             effect = PitchShift(**params)
-            self._pedalboard.append(effect)
+            self._append_effect("pitchshift", effect, params)
             print("Added Pitch Shift with:", params)
 
     def _add_delay(self):
@@ -434,7 +1105,7 @@ class MainWindow(QMainWindow):
         if dialog.exec():
             params = dialog.get_parameters()
             effect = Delay(**params)
-            self._pedalboard.append(effect)
+            self._append_effect("delay", effect, params)
             print("Added Delay with:", params)
 
     def _add_distortion(self):
@@ -442,7 +1113,7 @@ class MainWindow(QMainWindow):
         if dialog.exec():
             params = dialog.get_parameters()
             effect = Distortion(**params)
-            self._pedalboard.append(effect)
+            self._append_effect("distortion", effect, params)
             print("Added Distortion with:", params)
 
     def _add_chorus(self):
@@ -450,7 +1121,7 @@ class MainWindow(QMainWindow):
         if dialog.exec():
             params = dialog.get_parameters()
             effect = Chorus(**params)
-            self._pedalboard.append(effect)
+            self._append_effect("chorus", effect, params)
             print("Added Chorus with:", params)
 
     def _add_phaser(self):
@@ -458,7 +1129,7 @@ class MainWindow(QMainWindow):
         if dialog.exec():
             params = dialog.get_parameters()
             effect = Phaser(**params)
-            self._pedalboard.append(effect)
+            self._append_effect("phaser", effect, params)
             print("Added Phaser with:", params)
 
     def _add_limiter(self):
@@ -466,7 +1137,7 @@ class MainWindow(QMainWindow):
         if dialog.exec():
             params = dialog.get_parameters()
             effect = Limiter(**params)
-            self._pedalboard.append(effect)
+            self._append_effect("limiter", effect, params)
             print("Added Limiter with:", params)
 
     def _add_ladder_filter(self):
@@ -474,25 +1145,21 @@ class MainWindow(QMainWindow):
         if dialog.exec():
             params = dialog.get_parameters()
             effect = LadderFilter(**params)
-            self._pedalboard.append(effect)
+            self._append_effect("ladder", effect, params)
             print("Added Ladder Filter with:", params)
 
     def _add_convolution(self):
         dialog = ConvolutionOptionsDialog(self)
         if dialog.exec():
             params = dialog.get_parameters()
-            effect = Convolution(**params)
-            self._pedalboard.append(effect)
+            try:
+                effect = Convolution(**params)
+            except RuntimeError as e:
+                QMessageBox.critical(self, "Invalid effect", str(e))
+                return
+            self._append_effect("convolution", effect, params)
             print("Added Convolution with:", params)
 
-    def _add_mix(self):
-        dialog = MixOptionsDialog(self)
-        if dialog.exec():
-            params = dialog.get_parameters()
-            effect = Mix(**params)
-            self._pedalboard.append(effect)
-            print("Added Mix with:", params)
-
     def bar_reset(self) -> None:
         """
         Reset the position of the bar
@@ -523,6 +1190,19 @@ class MainWindow(QMainWindow):
         self._toolbar.addWidget(QLabel("Traversal"))
         self._toolbar.addWidget(self.action__traversal)
 
+        self.action__engine = QComboBox()
+        self.action__engine.addItems([
+            "Oscillator",
+            "IFFT",
+        ])
+        self.action__engine.setToolTip("Oscillator: one sine per pixel row\n"
+                                       "IFFT: each column as a spectrum, faster only "
+                                       "from about 4096 rows,\npitch rounded to the "
+                                       "FFT bins (about 11 Hz apart at DPC 0.01)")
+
+        self._toolbar.addWidget(QLabel("Engine"))
+        self._toolbar.addWidget(self.action__engine)
+
         self._toolbar.addWidget(QLabel("DPC"))
         self.action__dpc = QLineEdit("0.01")
         self._toolbar.addWidget(self.action__dpc)
@@ -542,63 +1222,287 @@ class MainWindow(QMainWindow):
 
         self.action__sonify.triggered.connect(self._sonify)
 
+        self.action__stream = QAction("Stream")
+        self.action__stream.setCheckable(True)
+        self.action__stream.setToolTip("Start playing while the image is still being sonified")
+        self._toolbar.addAction(self.action__stream)
+
+        self.action__live = QAction("Live")
+        self.action__live.setCheckable(True)
+        self.action__live.setToolTip("Sonify again as soon as the traversal, engine, "
+                                     "DPC or sample rate change")
+        self._toolbar.addAction(self.action__live)
+
+        self.action__traversal.currentIndexChanged.connect(self._parameters_changed)
+        self.action__engine.currentIndexChanged.connect(self._parameters_changed)
+        self.action__dpc.textEdited.connect(self._parameters_changed)
+        self.action__samplerate.textEdited.connect(self._parameters_changed)
+
         self.action__play = QAction("Play")
         self._toolbar.addAction(self.action__play)
         self.action__play.setEnabled(self._playable)
 
         self.action__play.triggered.connect(self._play)
 
+        # Only shown once there are preset variants to switch between
+        self.action__variant = QComboBox()
+        self.action__variant.currentIndexChanged.connect(self._select_variant)
+        self._variant_actions = [self._toolbar.addWidget(QLabel("Variant")),
+                                 self._toolbar.addWidget(self.action__variant)]
+        for action in self._variant_actions:
+            action.setVisible(False)
+
         self.addToolBar(self._toolbar)
 
+    def _init_statusbar(self) -> None:
+        """
+        Initialize the statusbar with the sonification progress
+        """
+        self._progress_bar = QProgressBar()
+        self._progress_bar.setRange(0, 100)
+        self._progress_bar.setMaximumWidth(200)
+        self._progress_bar.setVisible(False)
+
+        self._cancel_button = QPushButton("Cancel")
+        self._cancel_button.clicked.connect(self._cancel_task)
+        self._cancel_button.setVisible(False)
+
+        self._drift_label = QLabel()
+        self._trace_label = QLabel()
+        self._trace_label.setVisible(TRACER.enabled)
+        self.statusBar().addPermanentWidget(self._trace_label)
+        self.statusBar().addPermanentWidget(self._drift_label)
+        self.statusBar().addPermanentWidget(self._progress_bar)
+        self.statusBar().addPermanentWidget(self._cancel_button)
+
+    def _show_audio_health(self) -> None:
+        """
+        Open the audio callback telemetry, it updates while playing
+        """
+        self._audio_health_dialog = AudioHealthDialog(self._audio_controller, self)
+        self._audio_health_dialog.show()
+
+    def _toggle_tracing(self, enabled: bool) -> None:
+        TRACER.enabled = enabled
+        self._trace_label.setVisible(enabled)
+
+    def _show_trace(self) -> None:
+        """
+        Show where the time of the last traced run went
+        """
+        if not TRACER.enabled:
+            return
+        breakdown = TRACER.breakdown(self._trace_mark)
+        self._trace_label.setText(f"Last run: {sum(breakdown.values()) * 1000:.0f} ms")
+        self._trace_label.setToolTip("\n".join(f"{name}: {seconds * 1000:.1f} ms"
+                                               for name, seconds in breakdown.items()))
+        self.statusBar().showMessage(TRACER.summary(self._trace_mark), 10000)
+
+    def _export_trace(self) -> None:
+        """
+        Save the trace for chrome://tracing or Perfetto
+        """
+        filename, _ = QFileDialog.getSaveFileName(self, filter="Chrome Trace (*.json)")
+        if filename != "":
+            TRACER.export(filename)
+
+    def _clear_trace(self) -> None:
+        TRACER.clear()
+        self._trace_mark = TRACER.mark()
+        self._trace_label.clear()
+        self._trace_label.setToolTip("")
+
+    def _set_sonify_busy(self, busy: bool) -> None:
+        """
+        Show or hide the progress of the running sonification
+        """
+        self._progress_bar.setValue(0)
+        self._progress_bar.setVisible(busy)
+        self._cancel_button.setVisible(busy)
+
+    def _stop_playback(self) -> None:
+        """
+        Stop the playback and the bar, keeping the audio position
+        """
+        self._playing = False
+        self._audio_controller.pause()
+        self._timer.stop()
+
     def _helper_sonify(self) -> None:
-        self._sample_rate = int(self.action__samplerate.text())
-        self._dpc = float(self.action__dpc.text())
-        self.sonify_obj = Sonify(file_path = self._filename,
-                                 dimension = self._dimension,
-                                 duration_per_column = self._dpc,
-                                 sample_rate = self._sample_rate)
-
-        match self.action__traversal.currentIndex():
-            case 0:
-                self.sonify_obj.LeftToRight()
-                self._traversal_mode = TraversalMode.LeftToRight
-            case 1:
-                self.sonify_obj.RightToLeft()
-                self._traversal_mode = TraversalMode.RightToLeft
-            case 2:
-                self.sonify_obj.TopToBottom()
-                self._traversal_mode = TraversalMode.TopToBottom
-            case 3:
-                self.sonify_obj.BottomToTop()
-                self._traversal_mode = TraversalMode.BottomToTop
-            case 4:
-                self.sonify_obj.CircleInward()
-                self._traversal_mode = TraversalMode.CircleInward
-            case 5:
-                self.sonify_obj.CircleOutward()
-                self._traversal_mode = TraversalMode.CircleOutward
+        sample_rate = int(self.action__samplerate.text())
+        dpc = float(self.action__dpc.text())
+        mode = TRAVERSAL_MODES[self.action__traversal.currentIndex()]
+        engine = SYNTHESIS_ENGINES[self.action__engine.currentIndex()]
+
+        self._trace_mark = TRACER.mark()
+        with span("_helper_sonify"):
+            # Drop whatever is running, its result would be stale anyway
+            self._cancel_sonify()
+            self._stop_playback()
+            self._stop_playlist()
+            self._stop_video()
+            self._clear_variants()
+
+            self._playable = False
+            self.action__play.setEnabled(self._playable)
+
+            self._sonify_job_id += 1
+            if self.action__stream.isChecked():
+                self._sonify_worker = StreamWorker(self._sonify_job_id, self._filename,
+                                                   self._dimension, dpc, sample_rate,
+                                                   mode, self._audio_cache,
+                                                   self._stream_prebuffer,
+                                                   image=self._image, engine=engine)
+                self._sonify_worker.signals.started.connect(self._stream_started)
+                self._sonify_worker.signals.ready.connect(self._stream_ready)
+            else:
+                self._sonify_worker = SonifyWorker(self._sonify_job_id, self._filename,
+                                                   self._dimension, dpc, sample_rate,
+                                                   mode,
+                                                   [] if self._live_effects else self._effect_chain,
+                                                   self._audio_cache, self._chain_renderer,
+                                                   image=self._image, engine=engine)
+            self._sonify_worker.signals.progress.connect(self._sonify_progress)
+            self._sonify_worker.signals.finished.connect(self._sonify_finished)
+            self._sonify_worker.signals.failed.connect(self._sonify_failed)
+
+            self._set_sonify_busy(True)
+            self._thread_pool.start(self._sonify_worker)
+
+    def _parameters_changed(self) -> None:
+        """
+        A toolbar parameter changed, in live mode sonify again once the
+        edits settle
+        """
+        if self.action__live.isChecked() and self._image is not None and self._video is None:
+            # Restarting the timer drops the edits made before it fired
+            self._live_timer.start()
+
+    def _live_sonify(self) -> None:
+        """
+        Sonify the loaded image with the new parameters. The decoded image
+        and the sine basis are reused, a job with the old parameters is
+        cancelled and cached audio is played back right away.
+        """
+        try:
+            dpc = float(self.action__dpc.text())
+            sample_rate = int(self.action__samplerate.text())
+        except ValueError:
+            self.statusBar().showMessage("Live: DPC and sample rate must be numbers", 3000)
+            return
+        if dpc <= 0 or sample_rate <= 0:
+            self.statusBar().showMessage("Live: DPC and sample rate must be positive", 3000)
+            return
+
+        play = self._playing or self._play_when_ready
+        self._helper_sonify()
+        self._play_when_ready = play
+
+    def _cancel_sonify(self) -> None:
+        """
+        Cancel the running sonification, if any
+        """
+        if self._sonify_worker is not None:
+            self._sonify_worker.cancel()
+            self._sonify_worker = None
+            self._play_when_ready = False
+            self._set_sonify_busy(False)
+            self.statusBar().showMessage("Sonification cancelled", 3000)
+
+    def _is_current_job(self, job_id: int) -> bool:
+        return (self._sonify_worker is not None
+                and self._sonify_worker.job_id == job_id)
+
+    def _sonify_progress(self, job_id: int, percent: int, stage: str) -> None:
+        if not self._is_current_job(job_id):
+            return
+        self._progress_bar.setValue(percent)
+        self.statusBar().showMessage(stage)
+
+    def _sonify_failed(self, job_id: int, message: str) -> None:
+        if not self._is_current_job(job_id):
+            return
+        self._sonify_worker = None
+        self._play_when_ready = False
+        self._set_sonify_busy(False)
+        self.statusBar().clearMessage()
+        QMessageBox.critical(self, "Sonification failed", message)
+
+    def _stream_started(self, job_id: int, growing) -> None:
+        """
+        A stream job has its buffer, hand it to the audio controller
+        """
+        if not self._is_current_job(job_id):
+            return
+
+        worker = self._sonify_worker
+        self._sample_rate = worker.sample_rate
+        self._dpc = worker.dpc
+        self._traversal_mode = worker.mode
+        self._source_key = worker.source_key()
+        self._streamed = True
+
+        self.init_bar_position()
+        with span("set_stream"):
+            self._audio_controller.set_stream(growing, self._sample_rate)
+        self._update_live_effects()
+
+    def _stream_ready(self, job_id: int) -> None:
+        """
+        Enough of the stream is rendered, start playing
+        """
+        if not self._is_current_job(job_id):
+            return
 
         self._playable = True
         self.action__play.setEnabled(self._playable)
-        self.init_bar_position()
+        if not self._playing:
+            self._pause_resume_requested()
 
-        self._audio = self.sonify_obj.audio * 0.5
+    def _sonify_finished(self, job_id: int, dry: np.ndarray, audio: np.ndarray) -> None:
+        if not self._is_current_job(job_id):
+            return
 
-        # Apply Effects
-        if len(self._active_effects) > 0:
-            self._audio = self._pedalboard(self._audio,
-                                           self._sample_rate)
+        worker = self._sonify_worker
+        self._sonify_worker = None
+        self._set_sonify_busy(False)
+        self.statusBar().showMessage(f"Audio cache: {self._audio_cache.hits} hits, "
+                                     f"{self._audio_cache.misses} misses", 5000)
 
-        if self._audio is not None:
+        self._dry_audio = dry
+        self._audio = audio
+
+        if isinstance(worker, StreamWorker):
+            # Already playing from the stream's buffer, which is now complete
+            self._show_trace()
+            return
+
+        self._sample_rate = worker.sample_rate
+        self._dpc = worker.dpc
+        self._traversal_mode = worker.mode
+        self._source_key = worker.source_key()
+        self._streamed = False
+
+        self._playable = True
+        self.action__play.setEnabled(self._playable)
+        self.init_bar_position()
+
+        with span("set_params"):
             self._audio_controller.set_params(self._audio,
                                               self._sample_rate)
+            self._update_live_effects()
+        self._show_trace()
+
+        if self._play_when_ready:
+            self._play_when_ready = False
+            self._pause_resume_requested()
 
     def _sonify(self) -> None:
         """
         Sonify loaded image
         """
 
-        if self._pixmap is None:
+        if self._pixmap is None or self._video is not None:
             if self._gui_open_image():
                 self._helper_sonify()
         else:
@@ -621,47 +1525,273 @@ class MainWindow(QMainWindow):
 
     def _save_audio(self) -> None:
         """
-        Saves the audio
+        Saves the audio from a worker thread, a block at a time
         """
 
         if self._audio is None or self._sample_rate is None:
             QMessageBox.warning(self, "No audio or sample rate defined",
                                 "Looks like you have not yet sonified any images!")
             return
-        filename, _ = QFileDialog.getSaveFileName(self)
-        if filename != "":
-            sf.write(filename, self._audio, self._sample_rate)
+        if self._export_worker is not None:
+            QMessageBox.warning(self, "Already saving",
+                                "Wait for the audio being saved or cancel it.")
+            return
+
+        filename, selected = QFileDialog.getSaveFileName(
+            self, filter=";;".join(f"{name} (*{extension})"
+                                   for name, (_, _, extension) in EXPORT_FORMATS.items()))
+        if filename == "":
+            return
+
+        name = selected.split(" (")[0]
+        extension = os.path.splitext(filename)[1].lower()
+        if name not in EXPORT_FORMATS or EXPORT_FORMATS[name][2] != extension:
+            # A typed extension wins over the selected format
+            name = next((other for other, (_, _, ext) in EXPORT_FORMATS.items()
+                         if ext == extension), name if name in EXPORT_FORMATS else "WAV 16-bit")
+        format, subtype, extension = EXPORT_FORMATS[name]
+        if not filename.lower().endswith(extension):
+            filename += extension
+
+        if self._effects_in_playback() and self._effect_chain:
+            # Playback applies the effects on the fly, apply them to the
+            # blocks on their way to the file
+            total = len(self._dry_audio)
+            blocks = apply_effects(array_blocks(self._dry_audio),
+                                   build_pedalboard(self._effect_chain), self._sample_rate)
+        else:
+            total = len(self._audio)
+            blocks = array_blocks(self._audio)
+
+        self._trace_mark = TRACER.mark()
+        self._export_worker = TaskWorker(export_audio, filename, blocks, self._sample_rate,
+                                         format, subtype, total)
+        self._export_worker.signals.progress.connect(self._progress_bar.setValue)
+        self._export_worker.signals.finished.connect(
+            lambda done: self._audio_saved(filename, done))
+        self._export_worker.signals.failed.connect(self._audio_save_failed)
+
+        self._progress_bar.setValue(0)
+        self._progress_bar.setVisible(True)
+        self._cancel_button.setVisible(True)
+        self.statusBar().showMessage(f"Saving {os.path.basename(filename)} ({name})")
+        self._thread_pool.start(self._export_worker)
+
+    def _audio_saved(self, filename: str, done: bool) -> None:
+        self._export_worker = None
+        self._set_sonify_busy(self._sonify_worker is not None)
+        self.statusBar().showMessage(f"Saved {os.path.basename(filename)}" if done
+                                     else "Saving audio cancelled", 5000)
+        self._show_trace()
+
+    def _audio_save_failed(self, message: str) -> None:
+        self._export_worker = None
+        self._set_sonify_busy(self._sonify_worker is not None)
+        self.statusBar().clearMessage()
+        QMessageBox.critical(self, "Saving audio failed", message)
+
+    def _cancel_task(self) -> None:
+        """
+        The status bar's Cancel button, stops the sonification and the
+        audio or video being exported
+        """
+        if self._export_worker is not None:
+            self._export_worker.cancel()
+        self._cancel_sonify()
+
+    @staticmethod
+    def _write_audio_file(path: str, audio: np.ndarray, sample_rate: int,
+                          renderer: EffectChainRenderer, source_key, chain: List,
+                          progress=None) -> int:
+        """
+        Worker job: write the audio to a WAV file for a video, running the
+        effect chain over it first if given. Returns the frames written.
+        """
+        if chain:
+            audio = renderer.render(source_key, audio, sample_rate, chain)
+        export_audio(path, array_blocks(audio), sample_rate, "WAV", "PCM_16",
+                     len(audio), progress)
+        return len(audio)
+
+    def _prepare_audio_file(self, ready) -> None:
+        """
+        Write the audio, with the effects applied, to a temporary WAV file
+        on the worker pool and call `ready(path, frames)` once it is there
+        """
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        # Playback applies the effects on the fly, render them for the file
+        chain = list(self._effect_chain) if self._effects_in_playback() else []
+        worker = TaskWorker(self._write_audio_file, path,
+                            self._dry_audio if chain else self._audio,
+                            self._sample_rate, self._chain_renderer,
+                            self._source_key, chain)
+
+        def finished(frames: int) -> None:
+            self._progress_bar.setVisible(False)
+            self.statusBar().clearMessage()
+            ready(path, frames)
+
+        def failed(message: str) -> None:
+            os.remove(path)
+            self._progress_bar.setVisible(False)
+            self.statusBar().clearMessage()
+            QMessageBox.critical(self, "Writing audio failed", message)
+
+        worker.signals.progress.connect(self._progress_bar.setValue)
+        worker.signals.finished.connect(finished)
+        worker.signals.failed.connect(failed)
+
+        self._progress_bar.setValue(0)
+        self._progress_bar.setVisible(True)
+        self.statusBar().showMessage("Writing audio")
+        self._thread_pool.start(worker)
+
+    def _export_video(self) -> None:
+        """
+        Render the playhead video offline, frame accurate to the audio
+        """
+        if self._audio is None or self._image is None:
+            QMessageBox.warning(self, "No audio or sample rate defined",
+                                "Looks like you have not yet sonified any images!")
+            return
+
+        if not VideoEncoder.available():
+            QMessageBox.warning(self, "ffmpeg not found",
+                                "Exporting video needs ffmpeg on the PATH.")
+            return
+
+        filename, _ = QFileDialog.getSaveFileName(
+            self, filter="Video Files (*.mp4 *.mkv *.mov)")
+        if filename == "":
+            return
+
+        self._prepare_audio_file(
+            lambda audio_path, frames: self._start_video_export(filename, audio_path, frames))
+
+    def _start_video_export(self, filename: str, audio_path: str, frames: int) -> None:
+        worker = TaskWorker(export_video, filename, self._image,
+                            self._traversal_mode, self._dpc,
+                            frames / self._sample_rate,
+                            audio_path=audio_path, fps=self._FPS,
+                            color=self._bar_color)
+        worker.signals.progress.connect(self._progress_bar.setValue)
+        worker.signals.finished.connect(
+            lambda frames: self._video_exported(audio_path, "Video export cancelled"
+                                                if frames is None else
+                                                f"Exported {frames} frames"))
+        worker.signals.failed.connect(
+            lambda message: self._video_exported(audio_path, message, failed=True))
+
+        # Cancelled with the status bar's Cancel button like saving audio
+        self._export_worker = worker
+        self._progress_bar.setValue(0)
+        self._progress_bar.setVisible(True)
+        self._cancel_button.setVisible(True)
+        self.statusBar().showMessage("Exporting video")
+        self._thread_pool.start(worker)
+
+    def _video_exported(self, audio_path: str, message: str, failed: bool = False) -> None:
+        os.remove(audio_path)
+        self._export_worker = None
+        self._set_sonify_busy(self._sonify_worker is not None)
+        if failed:
+            self.statusBar().clearMessage()
+            QMessageBox.critical(self, "Video export failed", message)
+        else:
+            self.statusBar().showMessage(message, 10000)
 
     def _screen_recording(self, record: bool) -> None:
         """
         Function that actually screen records.
         """
         if record:
+            self._trace_mark = TRACER.mark()
+            size = self._graphics_view.size()
+            self._video_encoder = VideoEncoder(self._capture_path,
+                                               size.width(), size.height(),
+                                               self._FPS,
+                                               audio_path=self._capture_audio_path,
+                                               audio_offset=self._audio_controller.position())
+            self._video_encoder.start()
+
             self.screen_record_timer = QTimer()
-            self.screen_record_timer.setInterval(int(1 / 60 * 1000))  # 60 FPS
+            self.screen_record_timer.setInterval(int(1 / self._FPS * 1000))
             self.screen_record_timer.timeout.connect(self._capture_graphicsview)
             self.screen_record_timer.start()
         else:
             self.screen_record_timer.stop()
             self.screen_record_timer = None
-            self._capture_index = 0
+
+            # Encoding the frames still queued takes a while, off the GUI thread
+            encoder = self._video_encoder
+            self._video_encoder = None
+            audio_path = self._capture_audio_path
+            self._capture_audio_path = None
+            worker = TaskWorker(encoder.stop)
+            worker.signals.progress.connect(self._progress_bar.setValue)
+            worker.signals.finished.connect(
+                lambda _: self._recording_finished(encoder, audio_path))
+            worker.signals.failed.connect(
+                lambda message: self._recording_finished(encoder, audio_path, message))
+
+            self._progress_bar.setValue(0)
+            self._progress_bar.setVisible(True)
+            self.statusBar().showMessage("Finishing the recording")
+            self._thread_pool.start(worker)
+
+    def _recording_finished(self, encoder: VideoEncoder, audio_path: str,
+                            message: str = None) -> None:
+        self._progress_bar.setVisible(False)
+        self.statusBar().clearMessage()
+        if audio_path is not None:
+            os.remove(audio_path)
+
+        error = message or encoder.error
+        if error:
+            QMessageBox.critical(self, "Screen recording failed", error)
+        else:
+            self.statusBar().showMessage(
+                f"Recorded {encoder.frames_captured} frames at "
+                f"{encoder.achieved_fps:.1f} FPS, {encoder.frames_dropped} dropped",
+                10000)
+            self._show_trace()
 
     def _capture_graphicsview(self):
         """
         Timer callback for capturing image of the graphics view
         """
-        pixmap = self._graphics_view.grab()
-        pic_path = os.path.join(self._capture_dir, str(self._capture_index) + ".png")
-        self._capture_index += 1
-        pixmap.save(pic_path)
-        print("Saving")
+        with span("capture frame"):
+            encoder = self._video_encoder
+            image = self._graphics_view.grab().toImage()
+            if image.width() != encoder.width or image.height() != encoder.height:
+                image = image.scaled(encoder.width, encoder.height)
+            image = image.convertToFormat(QImage.Format.Format_RGBA8888)
+            # The encoder thread owns the copy, the QImage can go
+            encoder.push(image.constBits().asstring(image.sizeInBytes()))
 
     def _screen_record(self) -> None:
         """
         Record the QGraphicsView.
         """
+        if not VideoEncoder.available():
+            QMessageBox.warning(self, "ffmpeg not found",
+                                "Screen recording needs ffmpeg on the PATH.")
+            return
 
-        self._capture_dir = QFileDialog.getExistingDirectory(self)
+        self._capture_path, _ = QFileDialog.getSaveFileName(
+            self, filter="Video Files (*.mp4 *.mkv *.mov)")
+        if self._capture_path == "":
+            return
+
+        # Mux the audio in the recording
+        self._capture_audio_path = None
+        if self._audio is not None:
+            self._prepare_audio_file(self._open_screen_record_dialog)
+        else:
+            self._open_screen_record_dialog(None, 0)
 
-        d = ScreenRecordDialog()
-        d.start_recording_signal.connect(self._screen_recording)
+    def _open_screen_record_dialog(self, audio_path: str, frames: int) -> None:
+        self._capture_audio_path = audio_path
+        self._screen_record_dialog = ScreenRecordDialog()
+        self._screen_record_dialog.start_recording_signal.connect(self._screen_recording)
@@ -1,8 +1,11 @@
 from PyQt6.QtWidgets import QGraphicsView
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QWheelEvent
+from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtGui import QPaintEvent, QWheelEvent
 
 class GraphicsView(QGraphicsView):
+    # emitted after every paint of the view
+    painted = pyqtSignal()
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self._zoom_factor = 1.25  # Zoom in/out scaling factor
@@ -14,3 +17,6 @@ class GraphicsView(QGraphicsView):
         else:
             self.scale(1 / self._zoom_factor, 1 / self._zoom_factor)  # Zoom out
 
+    def paintEvent(self, event: QPaintEvent):
+        super().paintEvent(event)
+        self.painted.emit()
@@ -0,0 +1,208 @@
+import struct
+import sys
+import time
+import cv2
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from Tracing import span
+
+try:
+    import resource
+except ImportError:
+    # Windows, where the RSS high water mark is not recorded
+    resource = None
+
+# Reduced decode flags by reduction factor. libjpeg decodes straight at the
+# smaller scale; other codecs decode fully and shrink inside OpenCV
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+@dataclass
+class LoadStats:
+    """
+    How an image was loaded
+    """
+    source_size: Optional[Tuple[int, int]] = None
+    method: str = "full"
+    factor: int = 1
+    decode_seconds: float = 0.0
+    resize_seconds: float = 0.0
+    # Largest decoded buffer plus the output, the memory the load needed
+    peak_bytes: int = 0
+    # High water mark of the whole process after the load
+    max_rss_bytes: int = 0
+
+    def summary(self) -> str:
+        size = "x".join(map(str, self.source_size)) if self.source_size else "?"
+        return (f"{size} {self.method} 1/{self.factor}: "
+                f"decode {self.decode_seconds * 1000:.0f} ms, "
+                f"resize {self.resize_seconds * 1000:.0f} ms, "
+                f"peak {self.peak_bytes / 1024 ** 2:.1f} MB")
+
+
+def image_size(path: str) -> Optional[Tuple[int, int]]:
+    """
+    (width, height) from the file header, without decoding the image.
+    Supports PNG, JPEG, BMP, GIF and TIFF; None for anything else.
+    """
+    with open(path, "rb") as f:
+        head = f.read(32)
+
+        if head.startswith(b"\x89PNG\r\n\x1a\n"):
+            return struct.unpack(">II", head[16:24])
+
+        if head[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", head[6:10])
+
+        if head.startswith(b"BM"):
+            width, height = struct.unpack("<ii", head[18:26])
+            return width, abs(height)
+
+        if head[:4] in (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"):
+            return _tiff_size(f, head)
+
+        if head.startswith(b"\xff\xd8"):
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                    continue
+                length = struct.unpack(">H", f.read(2))[0]
+                # Start of frame markers, except DHT, JPG and DAC
+                if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack(">xHH", f.read(5))
+                    return width, height
+                f.seek(length - 2, 1)
+
+    return None
+
+
+def _tiff_size(f, head: bytes) -> Optional[Tuple[int, int]]:
+    """
+    ImageWidth and ImageLength of the first image of a TIFF or BigTIFF
+    """
+    order = "<" if head.startswith(b"II") else ">"
+    big = head[2:4] in (b"+\x00", b"\x00+")
+    if big:
+        offset = struct.unpack(order + "Q", head[8:16])[0]
+        count_format, entry_size, value_at = "Q", 20, 12
+    else:
+        offset = struct.unpack(order + "I", head[4:8])[0]
+        count_format, entry_size, value_at = "H", 12, 8
+
+    f.seek(offset)
+    count = struct.unpack(order + count_format, f.read(struct.calcsize(count_format)))[0]
+    entries = f.read(count * entry_size)
+    # SHORT, LONG and LONG8 values, stored in the entry itself
+    value_formats = {3: "H", 4: "I", 16: "Q"}
+    size = {}
+    for start in range(0, len(entries) - entry_size + 1, entry_size):
+        tag, kind = struct.unpack(order + "HH", entries[start:start + 4])
+        if tag in (256, 257) and kind in value_formats:
+            value = entries[start + value_at:start + entry_size]
+            size[tag] = struct.unpack_from(order + value_formats[kind], value)[0]
+
+    if 256 in size and 257 in size:
+        return size[256], size[257]
+    return None
+
+
+def reduction_factor(source: Tuple[int, int], target: Tuple[int, int]) -> int:
+    """
+    Largest reduced decode scale that still leaves at least the target
+    resolution to resize from
+    """
+    for factor in (8, 4, 2):
+        if source[0] // factor >= target[0] and source[1] // factor >= target[1]:
+            return factor
+    return 1
+
+
+def _bmp_memmap(path: str) -> Optional[np.ndarray]:
+    """
+    Memory map the pixels of an uncompressed 24 or 32 bit BMP as a
+    (height, width, channels) array, top row first
+    """
+    with open(path, "rb") as f:
+        header = f.read(54)
+    offset = struct.unpack("<I", header[10:14])[0]
+    width, height = struct.unpack("<ii", header[18:26])
+    bpp, compression = struct.unpack("<HI", header[28:34])
+    # Palette images need the palette to map to gray, let OpenCV do them
+    if compression != 0 or bpp not in (24, 32):
+        return None
+
+    channels = bpp // 8
+    row_bytes = (width * channels + 3) & ~3
+    rows = np.memmap(path, dtype=np.uint8, mode="r", offset=offset,
+                     shape=(abs(height), row_bytes))
+    pixels = rows[:, :width * channels].reshape(abs(height), width, channels)
+    # Positive height means the rows are stored bottom up
+    return pixels[::-1] if height > 0 else pixels
+
+
+def load_image(path: str, dimension: Tuple[int, int],
+               stats: Optional[LoadStats] = None) -> np.ndarray:
+    """
+    Read an image as grayscale resized to `dimension` (height, width),
+    without holding the full resolution image in memory where possible.
+
+    Uncompressed BMPs are memory mapped and subsampled; other formats are
+    decoded at the largest reduced scale above the target, then only the
+    remainder is resized.
+    """
+    if stats is None:
+        stats = LoadStats()
+
+    target = (dimension[1], dimension[0])
+    stats.source_size = image_size(path)
+    stats.factor = 1
+    if stats.source_size is not None:
+        stats.factor = reduction_factor(stats.source_size, target)
+
+    start = time.perf_counter()
+    image = None
+    with span("decode", factor=stats.factor):
+        if path.lower().endswith(".bmp") and stats.source_size is not None:
+            pixels = _bmp_memmap(path)
+            if pixels is not None:
+                stats.method = "mmap"
+                # Only the sampled rows and columns are read from the file
+                pixels = np.ascontiguousarray(pixels[::stats.factor, ::stats.factor])
+                image = cv2.cvtColor(pixels[:, :, :3], cv2.COLOR_BGR2GRAY)
+                stats.peak_bytes = pixels.nbytes + image.nbytes
+
+        if image is None:
+            stats.method = "reduced" if stats.factor > 1 else "full"
+            image = cv2.imread(path, _REDUCED_FLAGS[stats.factor])
+            if image is None:
+                raise FileNotFoundError(f"Image file not found or unreadable: {path}")
+            stats.peak_bytes = image.nbytes
+            with open(path, "rb") as f:
+                jpeg = f.read(2) == b"\xff\xd8"
+            if stats.factor > 1 and not jpeg:
+                # Decoded at full size before OpenCV shrinks it
+                stats.peak_bytes += stats.source_size[0] * stats.source_size[1]
+    stats.decode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with span("resize"):
+        resized = cv2.resize(image, target, interpolation=cv2.INTER_AREA)
+    stats.resize_seconds = time.perf_counter() - start
+    stats.peak_bytes += resized.nbytes
+
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        stats.max_rss_bytes = rss if sys.platform == "darwin" else rss * 1024
+
+    return resized
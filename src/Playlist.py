@@ -0,0 +1,190 @@
+import os
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from PyQt6.QtCore import QObject, QThreadPool, pyqtSignal
+
+from visound.core.TraversalMode import TraversalMode
+
+from AudioCache import AudioCache
+from AudioFormat import AUDIO_DTYPE
+from EffectChain import EffectSpec, build_pedalboard
+from ImageLoader import load_image
+from Renderer import render
+from SonifyWorker import TaskWorker
+from Synthesis import SynthesisEngine, total_samples
+from Tracing import span
+
+
+def render_item(path: str, dimension: Tuple[int, int], dpc: float,
+                sample_rate: int, mode: TraversalMode, engine: SynthesisEngine,
+                chain: List[EffectSpec], cache: Optional[AudioCache] = None,
+                progress=None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Decode, sonify and apply the effect chain to one playlist image.
+    Returns the image and the audio, or None if `progress` returned False.
+    """
+    def report(percent: int, stage: str) -> bool:
+        return progress is None or progress(percent, 100)
+
+    with span("prefetch", file=os.path.basename(path)):
+        image = load_image(path, dimension)
+        audio = render(path, dimension, dpc, sample_rate, mode,
+                       build_pedalboard(chain) if chain else None,
+                       progress=report, cache=cache, image=image, engine=engine)
+    if audio is None:
+        return None
+    return image, audio
+
+
+class Playlist(QObject):
+    """
+    Images played one after another. While one plays, the audio of the
+    following ones is rendered in the background, at most `prefetch`
+    items ahead and only while the rendered and pending items fit in
+    `max_bytes`. The current item is always rendered.
+    """
+
+    # index of an item whose image and audio are ready
+    ready = pyqtSignal(int)
+    # index and error message of an item that could not be rendered
+    failed = pyqtSignal(int, str)
+
+    def __init__(self, paths: List[str], dimension: Tuple[int, int], dpc: float,
+                 sample_rate: int, mode: TraversalMode, engine: SynthesisEngine,
+                 chain: List[EffectSpec], thread_pool: QThreadPool,
+                 cache: Optional[AudioCache] = None, prefetch: int = 2,
+                 max_bytes: int = 512 * 1024 ** 2):
+        super().__init__()
+        self.paths = list(paths)
+        self.dimension = dimension
+        self.dpc = dpc
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.engine = engine
+        self.chain = chain
+        self.cache = cache
+        self.prefetch_depth = prefetch
+        self.max_bytes = max_bytes
+        self.current = 0
+        self._thread_pool = thread_pool
+        self._items: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        # index -> estimated bytes of the items being rendered
+        self._pending: Dict[int, int] = {}
+        self._workers: Dict[int, TaskWorker] = {}
+        self._failed = set()
+        # Bumped by stop(), results of older renders are dropped
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def item(self, index: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        The (image, audio) of an item, if it is rendered
+        """
+        return self._items.get(index)
+
+    def item_bytes(self) -> int:
+        """
+        Estimated memory of one rendered item, its audio and its image
+        """
+        height, width = self.dimension
+        return (total_samples(self.dimension, self.mode, self.dpc, self.sample_rate)
+                * np.dtype(AUDIO_DTYPE).itemsize + height * width)
+
+    def used_bytes(self) -> int:
+        return (sum(image.nbytes + audio.nbytes for image, audio in self._items.values())
+                + sum(self._pending.values()))
+
+    def name(self, index: int) -> str:
+        return os.path.basename(self.paths[index])
+
+    def source_key(self, index: int) -> Tuple:
+        """
+        Identifies the dry audio of an item for the staged effect rendering,
+        like SonifyWorker.source_key
+        """
+        path = self.paths[index]
+        return (path, os.path.getmtime(path), tuple(self.dimension), self.dpc,
+                self.sample_rate, self.mode, self.engine)
+
+    def prefetch(self) -> None:
+        """
+        Start rendering the items the budget allows, in playback order
+        """
+        estimate = self.item_bytes()
+        last = min(self.current + self.prefetch_depth, len(self) - 1)
+        for index in range(self.current, last + 1):
+            if index in self._items or index in self._pending or index in self._failed:
+                continue
+            if index != self.current and self.used_bytes() + estimate > self.max_bytes:
+                break
+            self._start(index, estimate)
+
+    def _start(self, index: int, estimate: int) -> None:
+        generation = self._generation
+        worker = TaskWorker(render_item, self.paths[index], self.dimension, self.dpc,
+                            self.sample_rate, self.mode, self.engine, self.chain,
+                            self.cache)
+        worker.signals.finished.connect(
+            lambda result: self._finished(generation, index, result))
+        worker.signals.failed.connect(
+            lambda message: self._failed_item(generation, index, message))
+        self._pending[index] = estimate
+        self._workers[index] = worker
+        self._thread_pool.start(worker)
+
+    def _finished(self, generation: int, index: int, result) -> None:
+        if generation != self._generation:
+            return
+        self._pending.pop(index, None)
+        self._workers.pop(index, None)
+        if index < self.current:
+            return
+        self._items[index] = result
+        self.ready.emit(index)
+        # A finished render may free budget estimated too high
+        self.prefetch()
+
+    def _failed_item(self, generation: int, index: int, message: str) -> None:
+        if generation != self._generation:
+            return
+        self._pending.pop(index, None)
+        self._workers.pop(index, None)
+        self._failed.add(index)
+        self.failed.emit(index, message)
+
+    def next_index(self) -> Optional[int]:
+        """
+        The item after the current one, skipping those that failed
+        """
+        index = self.current + 1
+        while index in self._failed:
+            index += 1
+        return index if index < len(self) else None
+
+    def advance(self) -> bool:
+        """
+        Drop the current item and move to the next one, returns False at
+        the end of the playlist
+        """
+        index = self.next_index()
+        if index is None:
+            return False
+        for skipped in range(self.current, index):
+            self._items.pop(skipped, None)
+        self.current = index
+        self.prefetch()
+        return True
+
+    def stop(self) -> None:
+        """
+        Drop the rendered items and cancel the renders still running
+        """
+        for worker in self._workers.values():
+            worker.cancel()
+        self._workers.clear()
+        self._generation += 1
+        self._items.clear()
+        self._pending.clear()
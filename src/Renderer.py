@@ -0,0 +1,169 @@
+import time
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+from pedalboard import Pedalboard
+
+from visound.core.TraversalMode import TraversalMode
+
+from AudioCache import AudioCache
+from AudioExport import apply_effects, array_blocks, export_audio, render_blocks
+from AudioFormat import AUDIO_DTYPE, check_audio
+from EffectChain import EffectSpec, build_pedalboard
+from ImageLoader import LoadStats, load_image
+from Synthesis import SynthesisEngine, synthesize, total_samples
+from Tracing import span
+
+# Same order as the entries of the traversal combo box in the toolbar
+TRAVERSAL_MODES = [
+    TraversalMode.LeftToRight,
+    TraversalMode.RightToLeft,
+    TraversalMode.TopToBottom,
+    TraversalMode.BottomToTop,
+    TraversalMode.CircleInward,
+    TraversalMode.CircleOutward,
+]
+
+# Command line names of the traversal modes, same as the visound cli
+MODE_NAMES = {
+    "left_to_right": TraversalMode.LeftToRight,
+    "right_to_left": TraversalMode.RightToLeft,
+    "top_to_bottom": TraversalMode.TopToBottom,
+    "bottom_to_top": TraversalMode.BottomToTop,
+    "circle_inward": TraversalMode.CircleInward,
+    "circle_outward": TraversalMode.CircleOutward,
+}
+
+# Same order as the entries of the engine combo box in the toolbar
+SYNTHESIS_ENGINES = [
+    SynthesisEngine.Oscillator,
+    SynthesisEngine.IFFT,
+]
+
+# Command line names of the synthesis engines
+ENGINE_NAMES = {
+    "oscillator": SynthesisEngine.Oscillator,
+    "ifft": SynthesisEngine.IFFT,
+}
+
+
+def render(file_path: str,
+           dimension: Tuple[int, int],
+           dpc: float,
+           sample_rate: int,
+           mode: TraversalMode,
+           pedalboard: Optional[Pedalboard] = None,
+           progress: Optional[Callable[[int, str], bool]] = None,
+           cache: Optional[AudioCache] = None,
+           image: Optional[np.ndarray] = None,
+           load_stats: Optional[LoadStats] = None,
+           engine: SynthesisEngine = SynthesisEngine.Oscillator) -> Optional[np.ndarray]:
+    """
+    Sonify an image and apply the effect chain without needing a GUI.
+
+    `image` is the already decoded and resized image, if the caller has
+    it; otherwise the file is loaded once, filling in `load_stats`.
+    `engine` picks how the audio is synthesized, see SynthesisEngine.
+
+    If a `cache` is given the sonified audio is looked up there first and
+    stored there after a miss.
+
+    `progress` is called with the percentage done and the name of the stage
+    about to run; if it returns False the render stops and None is returned.
+
+    The audio is AUDIO_DTYPE throughout; a fresh render is scaled in place.
+    """
+    if progress is None:
+        progress = lambda percent, stage: True
+
+    audio = None
+    if cache is not None:
+        if not progress(0, "Checking cache"):
+            return None
+        with span("cache lookup"):
+            key = cache.key(file_path, dimension, dpc, sample_rate, mode, engine)
+            audio = cache.get(key)
+
+    if audio is None:
+        if image is None:
+            if not progress(0, "Loading image"):
+                return None
+            image = load_image(file_path, dimension, load_stats)
+
+        if not progress(10, "Sonifying"):
+            return None
+        with span("synthesis", mode=mode.name, engine=engine.name):
+            audio = synthesize(image, mode, dpc, sample_rate, engine,
+                               lambda done, total: progress(10 + 70 * done // total,
+                                                            "Sonifying"))
+        if audio is None:
+            return None
+        check_audio("synthesis", audio)
+
+        if cache is not None:
+            with span("cache store"):
+                cache.put(key, audio)
+
+        audio *= 0.5
+    else:
+        # The cached audio is a read only memory map, scaling copies it once
+        with span("cache read"):
+            audio = np.multiply(audio, 0.5, dtype=AUDIO_DTYPE)
+
+    if pedalboard is not None and len(pedalboard) > 0:
+        if not progress(80, "Applying effects"):
+            return None
+        with span("effects", stages=len(pedalboard)):
+            audio = check_audio("effects", pedalboard(audio, sample_rate))
+
+    if not progress(100, "Done"):
+        return None
+
+    return audio
+
+
+# Caches of this worker process by (directory, size cap), kept between jobs
+# so the size of the cache is scanned once rather than for every image
+_caches: Dict[Tuple[str, int], AudioCache] = {}
+
+
+def _worker_cache(cache_dir: str, cache_size: int) -> AudioCache:
+    key = (cache_dir, cache_size)
+    if key not in _caches:
+        _caches[key] = AudioCache(cache_dir, cache_size)
+    return _caches[key]
+
+
+def sonify_file(image_path: str, output_path: str, dimension: Tuple[int, int],
+                dpc: float, sample_rate: int, mode: str, engine: str,
+                chain: List[EffectSpec], cache_dir: Optional[str],
+                cache_size: int, format: str, subtype: str,
+                stream: bool) -> Tuple[float, bool, LoadStats]:
+    """
+    Worker process job of sonify_batch and sonify_server: sonify one
+    image and write the audio file. `mode` and `engine` are command line
+    names.
+    Returns the time it took in seconds, whether it was a cache hit and
+    how the image was decoded.
+
+    With `stream` the audio is rendered and written a block at a time and
+    never exists as a whole, the cache is not used.
+    """
+    start = time.perf_counter()
+    stats = LoadStats()
+    if stream:
+        cache = None
+        image = load_image(image_path, dimension, stats)
+        total = total_samples(image.shape, MODE_NAMES[mode], dpc, sample_rate)
+        blocks = apply_effects(render_blocks(image, MODE_NAMES[mode], dpc, sample_rate,
+                                             ENGINE_NAMES[engine]),
+                               build_pedalboard(chain), sample_rate)
+    else:
+        cache = _worker_cache(cache_dir, cache_size) if cache_dir else None
+        hits = cache.hits if cache else 0
+        audio = render(image_path, dimension, dpc, sample_rate,
+                       MODE_NAMES[mode], build_pedalboard(chain), cache=cache,
+                       load_stats=stats, engine=ENGINE_NAMES[engine])
+        total = len(audio)
+        blocks = array_blocks(audio)
+    export_audio(output_path, blocks, sample_rate, format, subtype, total)
+    return time.perf_counter() - start, cache is not None and cache.hits > hits, stats
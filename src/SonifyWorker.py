@@ -0,0 +1,244 @@
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+import os
+import numpy as np
+from typing import List, Optional, Tuple
+
+from visound.core.TraversalMode import TraversalMode
+
+from AudioCache import AudioCache
+from AudioController import GrowingBuffer
+from AudioFormat import AUDIO_DTYPE
+from EffectChain import EffectChainRenderer, EffectSpec
+from ImageLoader import load_image
+from Renderer import render
+import Synthesis
+from Synthesis import SynthesisEngine
+from Tracing import span
+
+
+class SonifyWorkerSignals(QObject):
+    # job id, percentage done, stage name
+    progress = pyqtSignal(int, int, str)
+    # job id, audio before effects, audio after effects
+    finished = pyqtSignal(int, object, object)
+    # job id, error message
+    failed = pyqtSignal(int, str)
+
+
+class SonifyWorker(QRunnable):
+    """
+    Sonifies an image and applies the effects on a QThreadPool thread.
+
+    Every worker carries a job id so the GUI can drop the results of stale
+    jobs. Cancelling is checked between stages, a cancelled worker emits
+    nothing once it notices.
+    """
+
+    def __init__(self, job_id: int, file_path: str, dimension: Tuple[int, int],
+                 dpc: float, sample_rate: int, mode: TraversalMode,
+                 chain: List[EffectSpec], cache: Optional[AudioCache] = None,
+                 chain_renderer: Optional[EffectChainRenderer] = None,
+                 image: Optional[np.ndarray] = None,
+                 engine: SynthesisEngine = SynthesisEngine.Oscillator):
+        super().__init__()
+        self.job_id = job_id
+        self.file_path = file_path
+        self.dimension = dimension
+        self.dpc = dpc
+        self.sample_rate = sample_rate
+        self.mode = mode
+        # Snapshot the chain so effects added while rendering do not race
+        self.chain = list(chain)
+        self.cache = cache
+        self.chain_renderer = chain_renderer or EffectChainRenderer()
+        self.image = image
+        self.engine = engine
+        self.signals = SonifyWorkerSignals()
+        self._cancelled = False
+
+    def cancel(self) -> None:
+        self._cancelled = True
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def _progress(self, percent: int, stage: str) -> bool:
+        if self._cancelled:
+            return False
+        self.signals.progress.emit(self.job_id, percent, stage)
+        return True
+
+    def _render_progress(self, percent: int, stage: str) -> bool:
+        if not self.chain:
+            return self._progress(percent, stage)
+        return self._progress(percent * 80 // 100, stage)
+
+    def _effects_progress(self, stage: int, stages: int) -> bool:
+        return self._progress(80 + 20 * stage // stages,
+                              f"Applying effects ({stage + 1}/{stages})")
+
+    def source_key(self) -> Tuple:
+        """
+        Identifies the dry audio for the staged effect rendering
+        """
+        return (self.file_path, os.path.getmtime(self.file_path),
+                tuple(self.dimension), self.dpc, self.sample_rate, self.mode,
+                self.engine)
+
+    def run(self) -> None:
+        try:
+            with span("sonify job", job=self.job_id):
+                audio = render(self.file_path, self.dimension, self.dpc,
+                               self.sample_rate, self.mode,
+                               progress=self._render_progress, cache=self.cache,
+                               image=self.image, engine=self.engine)
+                dry = audio
+                if audio is not None and self.chain:
+                    audio = self.chain_renderer.render(self.source_key(), audio,
+                                                       self.sample_rate, self.chain,
+                                                       progress=self._effects_progress)
+        except Exception as e:
+            if not self._cancelled:
+                self.signals.failed.emit(self.job_id, str(e))
+            return
+
+        if audio is not None and not self._cancelled:
+            self.signals.finished.emit(self.job_id, dry, audio)
+
+
+class StreamWorkerSignals(SonifyWorkerSignals):
+    # job id, buffer being filled
+    started = pyqtSignal(int, object)
+    # job id, emitted once enough audio is ready to start playing
+    ready = pyqtSignal(int)
+
+
+class StreamWorker(SonifyWorker):
+    """
+    Sonifies an image one column, row or ring at a time into a
+    GrowingBuffer, so playback can start before the render is done.
+
+    The effects are not rendered here, they are applied during playback.
+    """
+
+    def __init__(self, job_id: int, file_path: str, dimension: Tuple[int, int],
+                 dpc: float, sample_rate: int, mode: TraversalMode,
+                 cache: Optional[AudioCache] = None, prebuffer: float = 2.0,
+                 image: Optional[np.ndarray] = None,
+                 engine: SynthesisEngine = SynthesisEngine.Oscillator):
+        super().__init__(job_id, file_path, dimension, dpc, sample_rate, mode,
+                         [], cache, image=image, engine=engine)
+        self.prebuffer = prebuffer
+        self.signals = StreamWorkerSignals()
+
+    def run(self) -> None:
+        try:
+            with span("stream job", job=self.job_id):
+                self._stream()
+        except Exception as e:
+            if not self._cancelled:
+                self.signals.failed.emit(self.job_id, str(e))
+
+    def _stream(self) -> None:
+        cached = None
+        if self.cache is not None:
+            if not self._progress(0, "Checking cache"):
+                return
+            with span("cache lookup"):
+                key = self.cache.key(self.file_path, self.dimension, self.dpc,
+                                     self.sample_rate, self.mode, self.engine)
+                cached = self.cache.get(key)
+
+        if cached is None and self.image is None:
+            if not self._progress(0, "Loading image"):
+                return
+            self.image = load_image(self.file_path, self.dimension)
+
+        if cached is not None:
+            growing = GrowingBuffer(len(cached))
+            growing.write(0, cached)
+            # Nothing plays from it before started is emitted
+            growing.data *= 0.5
+            chunks = iter(())
+        else:
+            growing = GrowingBuffer(Synthesis.total_samples(
+                self.image.shape, self.mode, self.dpc, self.sample_rate))
+            chunks = Synthesis.stream(self.image, self.mode, self.dpc,
+                                      self.sample_rate, self.engine)
+            # Kept unscaled for the cache, like Sonify.audio
+            raw = np.zeros(len(growing), dtype=AUDIO_DTYPE)
+
+        self.signals.started.emit(self.job_id, growing)
+
+        prebuffer = int(self.prebuffer * self.sample_rate)
+        ready_sent = False
+        percent = 0
+        with span("synthesis", mode=self.mode.name, engine=self.engine.name):
+            for start, chunk in chunks:
+                if self._cancelled:
+                    return
+                raw[start:start + len(chunk)] += chunk
+                growing.write(start, chunk * 0.5)
+
+                if not ready_sent and growing.ready >= prebuffer:
+                    self.signals.ready.emit(self.job_id)
+                    ready_sent = True
+                if 100 * start // len(growing) > percent:
+                    percent = 100 * start // len(growing)
+                    self._progress(percent, "Sonifying")
+
+        growing.finish()
+        if cached is None and self.cache is not None:
+            with span("cache store"):
+                self.cache.put(key, raw)
+
+        if self._cancelled:
+            return
+        if not ready_sent:
+            self.signals.ready.emit(self.job_id)
+        audio = growing.data[:, 0]
+        self.signals.finished.emit(self.job_id, audio, audio)
+
+
+class TaskWorkerSignals(QObject):
+    # percentage done
+    progress = pyqtSignal(int)
+    # result of the function
+    finished = pyqtSignal(object)
+    # error message
+    failed = pyqtSignal(str)
+
+
+class TaskWorker(QRunnable):
+    """
+    Runs a function on a QThreadPool thread. The function is given a
+    `progress(done, total)` callback as keyword argument, which returns
+    False once the task is cancelled.
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = TaskWorkerSignals()
+        self._cancelled = False
+
+    def cancel(self) -> None:
+        """
+        Ask the function to stop, through its progress callback
+        """
+        self._cancelled = True
+
+    def _progress(self, done: int, total: int) -> bool:
+        self.signals.progress.emit(int(100 * done / total) if total else 100)
+        return not self._cancelled
+
+    def run(self) -> None:
+        try:
+            result = self.fn(*self.args, progress=self._progress, **self.kwargs)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.finished.emit(result)
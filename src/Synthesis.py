@@ -0,0 +1,362 @@
+import threading
+import numpy as np
+from collections import OrderedDict
+from enum import Enum
+from functools import lru_cache
+from typing import Callable, Iterator, Optional, Tuple
+
+from visound.core.TraversalMode import TraversalMode
+
+from AudioFormat import AUDIO_DTYPE
+
+
+class SynthesisEngine(Enum):
+    # One sinusoid per pixel row, summed, as visound's Sonify does
+    Oscillator = 0
+    # Each column as a magnitude spectrum, batched inverse FFT + overlap-add
+    IFFT = 1
+
+
+# Sonify.LeftToRight only sounds brighter pixels than the other traversals
+_THRESHOLDS = {
+    TraversalMode.LeftToRight: 0.5,
+    TraversalMode.RightToLeft: 0.1,
+    TraversalMode.TopToBottom: 0.1,
+    TraversalMode.BottomToTop: 0.1,
+}
+
+
+def pixel_to_freq(y, height: int):
+    """
+    Same mapping of pixel row to frequency as Sonify.pixel_to_freq
+    """
+    return 500 + (1 - y / height) * 1800
+
+
+def max_radius(shape: Tuple[int, int]) -> int:
+    height, width = shape
+    center = (width // 2, height // 2)
+    return int(np.hypot(center[0], center[1]))
+
+
+def playhead_center(shape: Tuple[int, int]) -> Tuple[int, int]:
+    """
+    The (x, y) the circle playhead is drawn around on an image of `shape`,
+    by MainWindow and by the exported video alike
+    """
+    height, width = shape
+    return width // 2, height // 2
+
+
+def total_samples(shape: Tuple[int, int], mode: TraversalMode, dpc: float,
+                  sample_rate: int) -> int:
+    """
+    Length of the audio Sonify produces for an image of `shape`
+    """
+    height, width = shape
+    if mode in (TraversalMode.CircleInward, TraversalMode.CircleOutward):
+        return int(max_radius(shape) * dpc * sample_rate)
+    return int(width * dpc * sample_rate)
+
+
+class BasisCache:
+    """
+    Sine basis of every row frequency over one slot, per (height, sample
+    rate, duration per column). The basis does not depend on the image, so
+    it is built once and shared by every render in the process.
+
+    The least recently used bases are dropped once they take more than
+    `max_bytes`. The arrays handed out are read only.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._bases: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+
+    def get(self, height: int, sample_rate: int, dpc: float) -> np.ndarray:
+        """
+        The (height, samples per column) basis, row y at pixel_to_freq(y)
+        """
+        key = (int(height), int(sample_rate), float(dpc))
+        with self._lock:
+            basis = self._bases.get(key)
+            if basis is not None:
+                self._bases.move_to_end(key)
+                self.hits += 1
+                return basis
+            self.misses += 1
+
+        # Built outside the lock, two threads may both build the same
+        # basis but neither blocks the other
+        t = np.linspace(0, dpc, int(dpc * sample_rate), endpoint=False)
+        basis = np.sin(2 * np.pi * pixel_to_freq(np.arange(height), height)[:, None] * t)
+        basis = basis.astype(AUDIO_DTYPE)
+        basis.flags.writeable = False
+
+        with self._lock:
+            self._bases[key] = basis
+            self._bases.move_to_end(key)
+            self._evict()
+        return basis
+
+    def cached_bytes(self) -> int:
+        return sum(basis.nbytes for basis in self._bases.values())
+
+    def _evict(self) -> None:
+        # The newest basis is kept even if it alone is over the cap
+        while len(self._bases) > 1 and self.cached_bytes() > self.max_bytes:
+            self._bases.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._bases.clear()
+
+
+# Shared by the GUI's sonify jobs and by every file of a batch worker
+BASIS_CACHE = BasisCache()
+
+
+@lru_cache(maxsize=16)
+def radial_index(shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The pixels Sonify samples on every ring of an image of `shape`, in
+    CSR form: the flat pixel indices (y * width + x) of the ring of radius
+    r are `indices[indptr[r]:indptr[r + 1]]`, for r up to max_radius.
+
+    Computed once per shape, the arrays are read only.
+    """
+    height, width = shape
+    center = (width // 2, height // 2)
+    theta = np.linspace(0, 2 * np.pi, num=360, endpoint=False)
+    radii = np.arange(max_radius(shape) + 1)[:, None]
+    # Sonify samples both coordinates around center[0]
+    x = np.clip((center[0] + radii * np.cos(theta)).astype(int), 0, width - 1)
+    y = np.clip((center[0] + radii * np.sin(theta)).astype(int), 0, height - 1)
+
+    indices = (y * width + x).ravel()
+    indptr = np.arange(len(radii) + 1) * len(theta)
+    indices.flags.writeable = False
+    indptr.flags.writeable = False
+    return indptr, indices
+
+
+def amplitudes(image: np.ndarray, mode: TraversalMode,
+               dpc: float, sample_rate: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    What every time slot (column, row or ring) of a traversal plays, as
+    the amplitude of each row frequency `pixel_to_freq(y)`.
+
+    Returns the (slots, height) amplitudes and the index of each slot, in
+    playback order. Slot i of the audio starts at `int(i * dpc * sample_rate)`.
+    """
+    height, width = image.shape
+    total = total_samples(image.shape, mode, dpc, sample_rate)
+
+    match mode:
+        case TraversalMode.LeftToRight | TraversalMode.RightToLeft:
+            intensity = np.divide(image.T, 255, dtype=AUDIO_DTYPE)
+            if mode == TraversalMode.RightToLeft:
+                intensity = intensity[::-1]
+            intensity[intensity <= _THRESHOLDS[mode]] = 0
+            return intensity, np.arange(width)
+
+        case TraversalMode.TopToBottom | TraversalMode.BottomToTop:
+            # Sonify sounds pixel (y, y) once for every column but the last
+            rows = np.arange(min(height, width))
+            if mode == TraversalMode.BottomToTop:
+                rows = np.arange(height - 1, -1, -1)
+                rows = rows[rows < width]
+            slots = np.arange(len(rows))
+            keep = (slots * dpc * sample_rate).astype(int) < total
+            rows, slots = rows[keep], slots[keep]
+
+            intensity = image[rows, rows] / 255.0
+            amps = np.zeros((len(rows), height), dtype=AUDIO_DTYPE)
+            amps[slots, rows] = np.where(intensity > _THRESHOLDS[mode],
+                                         (width - 1) * intensity, 0.0)
+            return amps, slots
+
+        case TraversalMode.CircleInward | TraversalMode.CircleOutward:
+            radius = max_radius(image.shape)
+            first = 0 if mode == TraversalMode.CircleInward else 1
+            slots = np.arange(first, radius)
+            if len(slots) == 0:
+                return np.zeros((0, height), dtype=AUDIO_DTYPE), slots
+
+            # Slot i plays ring radius - i, so the slots cover the rings
+            # from 1 to radius - first, a single slice of the index map
+            indptr, indices = radial_index(image.shape)
+            low, high = radius - slots[-1], radius - slots[0]
+            rows = indices[indptr[low]:indptr[high + 1]] // width
+            counts = np.diff(indptr[low:high + 2])
+            ring = np.repeat(np.arange(high - low + 1), counts)
+
+            # Every ring plays the mean of its points' row frequencies
+            amps = np.bincount(ring * height + rows,
+                               minlength=len(counts) * height)
+            amps = amps.reshape(len(counts), height) / counts[:, None]
+            return amps[::-1].astype(AUDIO_DTYPE), slots
+
+
+@lru_cache(maxsize=16)
+def _ifft_plan(height: int, sample_rate: int, dpc: float, oversample: int) -> Tuple:
+    """
+    What ifft_stream needs besides the image, computed once per size:
+    FFT length, the bins in use, the 0/1 matrix summing the rows into
+    them, the frame window and the rotation of each phase step.
+    """
+    length = 2 * int(dpc * sample_rate)
+    n_fft = oversample * (1 << (length - 1).bit_length())
+    bins = np.rint(pixel_to_freq(np.arange(height), height) * n_fft / sample_rate).astype(int)
+    used, row_bin = np.unique(bins, return_inverse=True)
+    mapping = np.zeros((height, len(used)), dtype=AUDIO_DTYPE)
+    mapping[np.arange(height), row_bin] = 1
+    window = np.hanning(length + 1)[:-1].astype(AUDIO_DTYPE)
+    # Bin k at a frame starting on sample s has turned s * k / n_fft times,
+    # less a quarter turn to get sines like the oscillators
+    rotation = (n_fft / 2 * np.exp(2j * np.pi * np.arange(n_fft) / n_fft
+                                   - 0.5j * np.pi)).astype(np.complex64)
+    for array in (used, mapping, window, rotation):
+        array.flags.writeable = False
+    return n_fft, used, mapping, window, rotation
+
+
+def ifft_stream(image: np.ndarray, mode: TraversalMode, dpc: float,
+                sample_rate: int, oversample: int = 4,
+                batch: int = 256) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Inverse FFT synthesis of a traversal, yielding (start sample, frame)
+    pairs to be added into the output in playback order.
+
+    Each slot's amplitudes are put on the FFT bins nearest to the row
+    frequencies, with the phase the sinusoid has at the frame's start so
+    consecutive frames line up. Frames are two slots long, centred on their
+    slot and Hann windowed, so they overlap-add back to the slot amplitudes.
+    `oversample` zero pads the FFT for a finer bin spacing.
+
+    A frame costs an FFT rather than a sine per row, so this only beats
+    the oscillators on tall images, and the pitch is rounded to the bins.
+    """
+    height = image.shape[0]
+    total = total_samples(image.shape, mode, dpc, sample_rate)
+    spc = int(dpc * sample_rate)
+    length = 2 * spc
+    n_fft, used, mapping, window, rotation = _ifft_plan(height, int(sample_rate),
+                                                       float(dpc), oversample)
+
+    amps, slots = amplitudes(image, mode, dpc, sample_rate)
+
+    for first in range(0, len(slots), batch):
+        batch_slots = slots[first:first + batch]
+        starts = (batch_slots * dpc * sample_rate).astype(int) - spc // 2
+
+        magnitudes = amps[first:first + batch] @ mapping
+        turns = np.outer(starts % n_fft, used) % n_fft
+        spectrum = np.zeros((len(batch_slots), n_fft // 2 + 1), dtype=np.complex64)
+        spectrum[:, used] = magnitudes * rotation[turns]
+
+        frames = np.fft.irfft(spectrum, n=n_fft, axis=1)[:, :length] * window
+
+        for start, frame in zip(starts, frames):
+            lo, hi = max(start, 0), min(start + length, total)
+            if hi > lo:
+                yield lo, frame[lo - start:hi - start]
+
+
+def oscillator_stream(image: np.ndarray, mode: TraversalMode, dpc: float,
+                      sample_rate: int, batch: int = 256) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Oscillator synthesis of a traversal as a matrix product of the slot
+    amplitudes against the cached sine basis, `batch` slots at a time
+    """
+    total = total_samples(image.shape, mode, dpc, sample_rate)
+    basis = BASIS_CACHE.get(image.shape[0], sample_rate, dpc)
+    amps, slots = amplitudes(image, mode, dpc, sample_rate)
+
+    for first in range(0, len(slots), batch):
+        chunks = amps[first:first + batch] @ basis
+        for slot, chunk in zip(slots[first:first + batch], chunks):
+            start = int(slot * dpc * sample_rate)
+            yield start, chunk[:total - start]
+
+
+def oscillator_window(amps: np.ndarray, slots: np.ndarray, dpc: float,
+                      sample_rate: int, total: int, start: int,
+                      length: int) -> np.ndarray:
+    """
+    Samples `start` to `start + length` of the oscillator synthesis of a
+    traversal with the slot amplitudes `amps` (see `amplitudes`), wrapping
+    around past the `total` samples. Lets a traversal keep going over an
+    image that changes while it plays.
+    """
+    basis = BASIS_CACHE.get(amps.shape[1], sample_rate, dpc)
+    spc = basis.shape[1]
+    out = np.zeros(length, dtype=AUDIO_DTYPE)
+
+    done = 0
+    while done < length:
+        position = (start + done) % total
+        # Slot starts are rounded down like in oscillator_stream, the
+        # estimate can be one off either way
+        slot = int(position / (dpc * sample_rate))
+        while int(slot * dpc * sample_rate) > position:
+            slot -= 1
+        while int((slot + 1) * dpc * sample_rate) <= position:
+            slot += 1
+        slot_start = int(slot * dpc * sample_rate)
+        slot_end = min(int((slot + 1) * dpc * sample_rate), total)
+        n = min(length - done, slot_end - position)
+
+        offset = position - slot_start
+        i = np.searchsorted(slots, slot)
+        if i < len(slots) and slots[i] == slot and offset < spc:
+            played = min(n, spc - offset)
+            out[done:done + played] = amps[i] @ basis[:, offset:offset + played]
+        done += n
+    return out
+
+
+def stream(image: np.ndarray, mode: TraversalMode, dpc: float,
+           sample_rate: int,
+           engine: SynthesisEngine = SynthesisEngine.Oscillator) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Sonify `image` one column, row or ring at a time, in playback order.
+
+    Yields (start sample, chunk) pairs; with the oscillator engine they add
+    up to the same audio as the corresponding Sonify traversal. Chunks can
+    overlap the previous ones, so they must be added, not copied, into the
+    output.
+    """
+    if engine == SynthesisEngine.IFFT:
+        yield from ifft_stream(image, mode, dpc, sample_rate)
+    else:
+        yield from oscillator_stream(image, mode, dpc, sample_rate)
+
+
+def synthesize(image: np.ndarray, mode: TraversalMode, dpc: float,
+               sample_rate: int,
+               engine: SynthesisEngine = SynthesisEngine.Oscillator,
+               progress: Optional[Callable[[int, int], bool]] = None) -> Optional[np.ndarray]:
+    """
+    The whole audio of a traversal.
+
+    `progress` is called with the samples done and the total whenever
+    another percent is done; if it returns False synthesis stops and None
+    is returned.
+    """
+    total = total_samples(image.shape, mode, dpc, sample_rate)
+    audio = np.zeros(total, dtype=AUDIO_DTYPE)
+    if total == 0:
+        # A DPC too short for even one sample per column, row or ring
+        return audio
+    percent = 0
+    for start, chunk in stream(image, mode, dpc, sample_rate, engine):
+        audio[start:start + len(chunk)] += chunk
+        if progress is not None and 100 * start // total > percent:
+            percent = 100 * start // total
+            if not progress(start, total):
+                return None
+    return audio
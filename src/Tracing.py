@@ -0,0 +1,129 @@
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List
+
+# SONIFY_TRACE=1 turns tracing on from the start; a value ending in .json
+# is also where the trace is written when the process exits
+TRACE_ENV = "SONIFY_TRACE"
+
+
+class Tracer:
+    """
+    Collects timing spans as Chrome trace events ("X" complete events,
+    microseconds since the tracer was created).
+
+    Spans cost a context manager and nothing else while tracing is off.
+    Only the newest `max_events` are kept.
+    """
+
+    def __init__(self, enabled: bool = False, max_events: int = 100000):
+        self.enabled = enabled
+        self._origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=max_events)
+        # Total number of events ever recorded, marks count from it
+        self._recorded = 0
+        self._threads: Dict[int, str] = {}
+
+    @contextlib.contextmanager
+    def _span(self, name: str, args: Dict):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            thread = threading.current_thread()
+            event = {"name": name, "ph": "X", "pid": os.getpid(),
+                     "tid": thread.ident,
+                     "ts": (start - self._origin) / 1000,
+                     "dur": (end - start) / 1000}
+            if args:
+                event["args"] = args
+            with self._lock:
+                self._threads[thread.ident] = thread.name
+                self._events.append(event)
+                self._recorded += 1
+
+    def span(self, name: str, **args):
+        """
+        Context manager timing the block it wraps as `name`, with `args`
+        shown on the event in the trace viewer
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._span(name, args)
+
+    def mark(self) -> int:
+        """
+        Position in the event stream, for `breakdown`
+        """
+        with self._lock:
+            return self._recorded
+
+    def events(self, since: int = 0) -> List[Dict]:
+        with self._lock:
+            first = self._recorded - len(self._events)
+            return list(self._events)[max(since - first, 0):]
+
+    def breakdown(self, since: int = 0) -> "OrderedDict[str, float]":
+        """
+        Seconds spent in every innermost span recorded since the `since`
+        mark, summed by name in the order they first ran
+        """
+        # Spans of a thread nest, so in start order a span has spans inside
+        # it exactly when the next one on its thread starts before it ends
+        events = sorted(self.events(since), key=lambda e: (e["ts"], -e["dur"]))
+        next_start = {}
+        leaves = []
+        for event in reversed(events):
+            following = next_start.get(event["tid"])
+            if following is None or following >= event["ts"] + event["dur"]:
+                leaves.append(event)
+            next_start[event["tid"]] = event["ts"]
+
+        totals = OrderedDict()
+        for event in reversed(leaves):
+            totals[event["name"]] = totals.get(event["name"], 0.0) + event["dur"] / 1e6
+        return totals
+
+    def summary(self, since: int = 0) -> str:
+        return ", ".join(f"{name} {seconds * 1000:.1f} ms"
+                         for name, seconds in self.breakdown(since).items())
+
+    def export(self, path: str) -> None:
+        """
+        Write the events as a Chrome trace, for chrome://tracing or Perfetto
+        """
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(),
+                     "tid": tid, "args": {"name": name}}
+                    for tid, name in threads.items()]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": metadata + events,
+                       "displayTimeUnit": "ms"}, f)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._events.clear()
+            self._threads.clear()
+
+
+TRACER = Tracer(enabled=bool(os.getenv(TRACE_ENV)))
+
+if os.getenv(TRACE_ENV, "").endswith(".json"):
+    atexit.register(TRACER.export, os.getenv(TRACE_ENV))
+
+
+def span(name: str, **args):
+    """
+    Time a block with the process-wide tracer
+    """
+    return TRACER.span(name, **args)
@@ -0,0 +1,152 @@
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Callable, Optional
+
+from Tracing import span
+
+
+class VideoEncoder:
+    """
+    Encodes captured frames into a video file with an ffmpeg process.
+
+    Frames are pushed from the GUI thread into a bounded queue and written
+    to ffmpeg by a background thread. When the queue is full the frame is
+    dropped and counted. Every frame carries its capture time and the
+    writer repeats or skips frames to keep a constant frame rate, so the
+    video stays in step with the muxed audio even with timer jitter.
+
+    ffmpeg's messages go to a temporary file rather than a pipe, so a
+    chatty encoder can never block on a full pipe nobody reads.
+    """
+
+    def __init__(self, path: str, width: int, height: int, fps: int,
+                 audio_path: Optional[str] = None, audio_offset: float = 0.0,
+                 queue_size: int = 120, ffmpeg: str = "ffmpeg"):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.audio_path = audio_path
+        self.audio_offset = audio_offset
+        self.ffmpeg = ffmpeg
+
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.frames_written = 0
+        self.error: Optional[str] = None
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._process = None
+        self._stderr = None
+        self._thread = None
+        self._start_time = None
+        self._stop_time = None
+
+    @staticmethod
+    def available(ffmpeg: str = "ffmpeg") -> bool:
+        return shutil.which(ffmpeg) is not None
+
+    def _command(self):
+        cmd = [self.ffmpeg, "-y", "-loglevel", "error",
+               "-f", "rawvideo", "-pix_fmt", "rgba",
+               "-s", f"{self.width}x{self.height}", "-r", str(self.fps),
+               "-i", "-"]
+        if self.audio_path:
+            cmd += ["-ss", f"{self.audio_offset:.6f}", "-i", self.audio_path]
+        # libx264 needs even dimensions
+        cmd += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p"]
+        if self.audio_path:
+            cmd += ["-c:a", "aac", "-shortest"]
+        cmd.append(self.path)
+        return cmd
+
+    def start(self) -> None:
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(self._command(),
+                                         stdin=subprocess.PIPE,
+                                         stderr=self._stderr)
+        self._start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def push(self, frame: bytes, timestamp: Optional[float] = None) -> bool:
+        """
+        Queue an RGBA frame of the encoder's size. Returns False if the
+        frame was dropped because the encoder is behind.
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        try:
+            self._queue.put_nowait((timestamp, frame))
+        except queue.Full:
+            self.frames_dropped += 1
+            return False
+
+        self.frames_captured += 1
+        return True
+
+    def _run(self) -> None:
+        last_frame = None
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            timestamp, frame = item
+            if self.error is not None:
+                # Keep draining so push and stop never block
+                continue
+
+            # Frame slot this capture belongs to, fill the gap up to it with
+            # the previous frame and skip it if the slot was already written
+            target = int(round((timestamp - self._start_time) * self.fps))
+            try:
+                with span("encode frame"):
+                    while self.frames_written < target and last_frame is not None:
+                        self._process.stdin.write(last_frame)
+                        self.frames_written += 1
+                    if self.frames_written <= target:
+                        self._process.stdin.write(frame)
+                        self.frames_written += 1
+            except (BrokenPipeError, OSError) as e:
+                self.error = str(e)
+            last_frame = frame
+
+    def stop(self, progress: Optional[Callable[[int, int], bool]] = None) -> None:
+        """
+        Flush the queued frames and wait for the video to be written. This
+        blocks until ffmpeg is done, so call it off the GUI thread;
+        `progress` is called with the queued frames encoded so far.
+        """
+        self._stop_time = time.perf_counter()
+        queued = self._queue.qsize()
+        self._queue.put(None)
+        while self._thread.is_alive():
+            self._thread.join(timeout=0.1)
+            if progress is not None:
+                progress(queued - min(self._queue.qsize(), queued), queued)
+        try:
+            self._process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.wait()
+        self._stderr.seek(0)
+        stderr = self._stderr.read()
+        self._stderr.close()
+        if self._process.returncode != 0 and self.error is None:
+            self.error = stderr.decode(errors="replace").strip() or \
+                f"{self.ffmpeg} exited with status {self._process.returncode}"
+
+    @property
+    def achieved_fps(self) -> float:
+        """
+        Frames captured per second of recording
+        """
+        end = self._stop_time or time.perf_counter()
+        if self._start_time is None or end <= self._start_time:
+            return 0.0
+        return self.frames_captured / (end - self._start_time)
@@ -0,0 +1,186 @@
+import math
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import cv2
+import numpy as np
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+from typing import Callable, Optional, Tuple
+
+from visound.core.TraversalMode import TraversalMode
+
+from Synthesis import max_radius, playhead_center
+
+# Shared with the worker processes by _init_worker: frames rendered by all
+# of them, and set to stop rendering
+_frames_done = None
+_cancelled = None
+
+
+def hex_to_rgb(color: str) -> Tuple[int, int, int]:
+    color = color.lstrip("#")
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def render_frame(image: np.ndarray, mode: TraversalMode, steps: int,
+                 color: Tuple[int, int, int], thickness: int = 2) -> np.ndarray:
+    """
+    Draw the playhead over the image after `steps` columns, rows or rings,
+    the same way MainWindow._advance_bar places it
+    """
+    height, width = image.shape[:2]
+    frame = image.copy()
+
+    match mode:
+        case TraversalMode.LeftToRight:
+            x = min(steps, width)
+            cv2.line(frame, (x, 0), (x, height), color, thickness)
+
+        case TraversalMode.RightToLeft:
+            x = max(width - steps, 0)
+            cv2.line(frame, (x, 0), (x, height), color, thickness)
+
+        case TraversalMode.TopToBottom:
+            y = min(steps, height)
+            cv2.line(frame, (0, y), (width, y), color, thickness)
+
+        case TraversalMode.BottomToTop:
+            y = max(height - steps, 0)
+            cv2.line(frame, (0, y), (width, y), color, thickness)
+
+        case TraversalMode.CircleInward | TraversalMode.CircleOutward:
+            limit = max_radius((height, width))
+            if mode == TraversalMode.CircleInward:
+                radius = max(limit - steps, 0)
+            else:
+                radius = min(steps, limit)
+            cv2.circle(frame, playhead_center((height, width)), radius, color, thickness)
+
+    return frame
+
+
+def frame_steps(index: int, fps: int, dpc: float) -> int:
+    """
+    Columns, rows or rings done at frame `index`. Rounded before flooring,
+    so a frame landing exactly on a step is not put one step short by
+    float error.
+    """
+    return math.floor(round(index / (fps * dpc), 9))
+
+
+def _init_worker(frames_done, cancelled) -> None:
+    global _frames_done, _cancelled
+    _frames_done = frames_done
+    _cancelled = cancelled
+
+
+def _render_segment(path: str, image: np.ndarray, mode: TraversalMode,
+                    dpc: float, fps: int, first: int, last: int,
+                    color: Tuple[int, int, int], ffmpeg: str) -> int:
+    """
+    Worker process job: render frames [first, last) into a video segment.
+    Stops early once the export is cancelled.
+    """
+    height, width = image.shape[:2]
+    stderr = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        [ffmpeg, "-y", "-loglevel", "error",
+         "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}",
+         "-r", str(fps), "-i", "-",
+         "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+         "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+         path],
+        stdin=subprocess.PIPE, stderr=stderr)
+
+    done = 0
+    for index in range(first, last):
+        if _cancelled is not None and _cancelled.is_set():
+            break
+        # Exact time of the frame, not the time it happens to be drawn
+        steps = frame_steps(index, fps, dpc)
+        process.stdin.write(render_frame(image, mode, steps, color).tobytes())
+        done += 1
+        if _frames_done is not None:
+            with _frames_done.get_lock():
+                _frames_done.value += 1
+
+    process.stdin.close()
+    if process.wait() != 0 and done == last - first:
+        stderr.seek(0)
+        raise RuntimeError(stderr.read().decode(errors="replace").strip())
+    return done
+
+
+def export_video(path: str, image: np.ndarray, mode: TraversalMode, dpc: float,
+                 duration: float, audio_path: Optional[str] = None,
+                 fps: int = 60, color: str = "#00FF00", scale: int = 1,
+                 workers: Optional[int] = None, ffmpeg: str = "ffmpeg",
+                 progress: Optional[Callable[[int, int], bool]] = None) -> Optional[int]:
+    """
+    Render the playhead video offline, frame `i` showing the playhead at
+    exactly `i / fps` seconds of audio. The frames are split into one
+    segment per worker process, the segments are then joined and muxed
+    with the audio without re-encoding. Returns the number of frames.
+
+    `progress` is called with the frames rendered by all the workers a few
+    times a second; if it returns False the workers stop, nothing is
+    written and None is returned.
+    """
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    if scale != 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale,
+                           interpolation=cv2.INTER_NEAREST)
+        dpc = dpc / scale
+
+    total = math.ceil(duration * fps)
+    workers = max(1, min(workers or os.cpu_count(), total))
+    bounds = np.linspace(0, total, workers + 1).astype(int)
+    rgb = hex_to_rgb(color)
+
+    # spawn, forking a process that runs Qt is not safe
+    context = multiprocessing.get_context("spawn")
+    frames_done = context.Value("q", 0)
+    cancelled = context.Event()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        segments = [os.path.join(tmp, f"segment_{i}.mp4") for i in range(workers)]
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(frames_done, cancelled)) as executor:
+            futures = [executor.submit(_render_segment, segments[i], image, mode,
+                                       dpc, fps, bounds[i], bounds[i + 1], rgb,
+                                       ffmpeg)
+                       for i in range(workers)]
+            pending = futures
+            while pending:
+                finished, pending = wait(pending, timeout=0.1, return_when=FIRST_EXCEPTION)
+                if any(future.exception() is not None for future in finished):
+                    # No use rendering the rest, the error is raised below
+                    cancelled.set()
+                if (progress is not None and not cancelled.is_set()
+                        and progress(frames_done.value, total) is False):
+                    cancelled.set()
+            for future in futures:
+                future.result()
+
+        if cancelled.is_set():
+            return None
+
+        list_path = os.path.join(tmp, "segments.txt")
+        with open(list_path, "w") as f:
+            f.writelines(f"file '{segment}'\n" for segment in segments)
+
+        cmd = [ffmpeg, "-y", "-loglevel", "error",
+               "-f", "concat", "-safe", "0", "-i", list_path]
+        if audio_path:
+            cmd += ["-i", audio_path, "-c:a", "aac"]
+        cmd += ["-c:v", "copy", path]
+
+        result = subprocess.run(cmd, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode(errors="replace").strip())
+
+    return total
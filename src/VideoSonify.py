@@ -0,0 +1,231 @@
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from pedalboard import Pedalboard
+from visound.core.TraversalMode import TraversalMode
+
+from AudioController import RingBuffer
+from EffectChain import EffectStream
+from Synthesis import amplitudes, oscillator_window, total_samples
+from Tracing import span
+
+
+@dataclass
+class VideoStats:
+    """
+    Progress of a video through the pipeline
+    """
+    decoded: int = 0
+    played: int = 0
+    # Frames skipped because the audio fell behind the source frame rate
+    dropped: int = 0
+    # Frames waiting between decoding and synthesis
+    queued: int = 0
+
+    def summary(self) -> str:
+        return (f"{self.played} played, {self.dropped} dropped, "
+                f"{self.decoded} decoded, {self.queued} queued")
+
+
+class VideoPipeline:
+    """
+    Sonifies a video frame by frame while it plays, on two threads:
+
+    decode: read, grayscale and resize a frame, into a queue of `queue_size`
+    synthesis: sonify the frame's share of the audio, into a ring buffer of
+        `buffer_seconds` that the AudioController plays from
+
+    Each stage blocks while the next one is full, so a fast decoder waits
+    for playback instead of reading ahead. The traversal keeps going across
+    frames at `dpc` seconds per column, row or ring, and wraps around at
+    the end; every frame plays 1 / fps seconds of it.
+
+    If synthesis cannot keep up, the audio runs dry and the silence played
+    meanwhile is made up by dropping frames, so the audio stays in step
+    with the source frame rate. The traversal moves on over dropped frames
+    too. Effects go through an EffectStream, so plugins with latency still
+    give every frame its exact share of audio.
+    """
+
+    def __init__(self, path: str, dimension: Tuple[int, int], dpc: float,
+                 sample_rate: int, mode: TraversalMode,
+                 pedalboard: Optional[Pedalboard] = None, queue_size: int = 8,
+                 buffer_seconds: float = 0.25):
+        self.path = path
+        self.dimension = dimension
+        self.dpc = dpc
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.pedalboard = pedalboard
+        self.stats = VideoStats()
+
+        self._capture = cv2.VideoCapture(path)
+        if not self._capture.isOpened():
+            raise ValueError(f"Could not open video {path}")
+        fps = self._capture.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps > 0 else 30.0
+
+        # Length of one sweep of the traversal, it wraps around after that
+        self.sweep_samples = total_samples(dimension, mode, dpc, sample_rate)
+        if self.sweep_samples == 0:
+            self._capture.release()
+            raise ValueError(f"A DPC of {dpc} is too short for a single sample per step")
+        self.ring = RingBuffer(int(buffer_seconds * sample_rate))
+        self._frames = queue.Queue(maxsize=queue_size)
+        # (first audio frame, video frame index, image, traversal sample) of
+        # the frames in the ring, for showing the frame being heard and
+        # where the traversal is
+        self._shown = deque(maxlen=int(buffer_seconds * self.fps) + queue_size + 2)
+        self._shown_lock = threading.Lock()
+        # Frames of missed audio made up for by dropping frames
+        self._repaid = 0
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._decode, name="video decode", daemon=True),
+                         threading.Thread(target=self._synthesize, name="video synthesis", daemon=True)]
+        self.error: Optional[str] = None
+
+    @property
+    def sweep_seconds(self) -> float:
+        return self.sweep_samples / self.sample_rate
+
+    @property
+    def finished(self) -> bool:
+        return self.ring.finished
+
+    @property
+    def ready(self) -> bool:
+        """
+        Enough audio is buffered to start playing without running dry
+        """
+        return self.ring.available >= len(self.ring.data) // 2 or self.finished
+
+    def start(self) -> None:
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop both stages and release the video
+        """
+        self._stop.set()
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(timeout=1.0)
+        self._capture.release()
+
+    def frame_at(self, audio_frame: int) -> Optional[Tuple[int, np.ndarray]]:
+        """
+        The (index, image) of the video frame whose audio plays at
+        `audio_frame`, counted in frames played since the start
+        """
+        with self._shown_lock:
+            for start, index, image, _ in reversed(self._shown):
+                if start <= audio_frame:
+                    return index, image
+        return None
+
+    def sweep_position(self, audio_frame: int) -> float:
+        """
+        Seconds into the traversal sweep of the audio at `audio_frame`,
+        counted like frame_at. Dropped frames move the traversal on, so
+        this runs ahead of the frames played.
+        """
+        with self._shown_lock:
+            for start, _, _, sweep in reversed(self._shown):
+                if start <= audio_frame:
+                    return ((sweep + audio_frame - start) % self.sweep_samples) / self.sample_rate
+        return (audio_frame % self.sweep_samples) / self.sample_rate
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._frames.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _decode(self) -> None:
+        height, width = self.dimension
+        index = 0
+        try:
+            while not self._stop.is_set():
+                with span("video decode", frame=index):
+                    ok, frame = self._capture.read()
+                    if not ok:
+                        break
+                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                    image = cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+                self.stats.decoded += 1
+                if not self._put((index, image)):
+                    return
+                index += 1
+        except Exception as e:
+            self.error = str(e)
+        # End of the video, or it failed
+        self._put(None)
+
+    def _synthesize(self) -> None:
+        sweep = 0
+        try:
+            effects = None
+            if self.pedalboard is not None and len(self.pedalboard) > 0:
+                # The ring buffer has the slack to wait for a chunk of PitchShift
+                effects = EffectStream(self.pedalboard, self.sample_rate, realtime=False)
+                effects.reset()
+
+            while not self._stop.is_set():
+                try:
+                    item = self._frames.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                self.stats.queued = self._frames.qsize()
+                if item is None:
+                    break
+
+                index, image = item
+                # Samples of the frame, rounded so they add up over the video
+                length = (round((index + 1) * self.sample_rate / self.fps)
+                          - round(index * self.sample_rate / self.fps))
+
+                if self.ring.missed > self._repaid:
+                    # Behind the source, skip this frame to catch up, the
+                    # traversal still moves on by its share
+                    self._repaid += length
+                    self.stats.dropped += 1
+                    sweep = (sweep + length) % self.sweep_samples
+                    continue
+
+                with span("video synthesis", frame=index):
+                    amps, slots = amplitudes(image, self.mode, self.dpc, self.sample_rate)
+                    audio = oscillator_window(amps, slots, self.dpc, self.sample_rate,
+                                              self.sweep_samples, sweep, length)
+                    audio *= 0.5
+                    if effects is not None:
+                        effects.process(audio, audio)
+
+                with self._shown_lock:
+                    self._shown.append((self.ring.written, index, image, sweep))
+                sweep = (sweep + length) % self.sweep_samples
+                self._write(audio)
+                self.stats.played += 1
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.ring.finish()
+
+    def _write(self, audio: np.ndarray) -> None:
+        """
+        Put the audio in the ring, waiting for the room to free up
+        """
+        done = 0
+        while done < len(audio) and not self._stop.is_set():
+            done += self.ring.write(audio[done:])
+            if done < len(audio):
+                time.sleep(0.005)
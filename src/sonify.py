@@ -3,6 +3,7 @@ from PyQt6.QtWidgets import QApplication
 import sys
 
 
-app = QApplication(sys.argv)
-m = MainWindow()
-app.exec()
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    m = MainWindow()
+    app.exec()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+import argparse
+import glob
+import os
+import sys
+import time
+import soundfile as sf
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+
+from AudioCache import default_cache_dir
+from EffectChain import build_pedalboard, load_preset, parse_effect
+from Renderer import ENGINE_NAMES, MODE_NAMES, sonify_file
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff")
+
+
+def collect_images(inputs: List[str]) -> List[str]:
+    """
+    Expand the directories and glob patterns given on the command line
+    into a sorted list of image files
+    """
+    files = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for name in os.listdir(item):
+                path = os.path.join(item, name)
+                if os.path.isfile(path) and name.lower().endswith(IMAGE_EXTENSIONS):
+                    files.add(path)
+        else:
+            for path in glob.glob(os.path.expanduser(item), recursive=True):
+                if os.path.isfile(path):
+                    files.add(path)
+
+    return sorted(files)
+
+
+def output_paths(images: List[str], output_dir: str, extension: str) -> Dict[str, str]:
+    """
+    Output file of every image, mirroring where it is under the directory
+    the images have in common, so `a/img.png` and `b/img.png` do not write
+    to the same file. Images that only differ in their extension keep it
+    in the output name.
+    """
+    if not images:
+        return {}
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in images])
+    relative = {p: os.path.relpath(os.path.abspath(p), root) for p in images}
+
+    stems = {}
+    for path, name in relative.items():
+        stem = os.path.splitext(name)[0]
+        stems[stem] = stems.get(stem, 0) + 1
+
+    outputs = {}
+    for path, name in relative.items():
+        stem = os.path.splitext(name)[0]
+        if stems[stem] > 1:
+            stem = name
+        outputs[path] = os.path.join(output_dir, f"{stem}.{extension}")
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sonify a batch of images without the GUI")
+    parser.add_argument("inputs", nargs="+",
+                        help="Image files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", default=".",
+                        help="Directory where the audio files are written")
+    parser.add_argument("--format", choices=["wav", "flac", "ogg"], default="wav",
+                        help="Output audio format")
+    parser.add_argument("--subtype", choices=["PCM_16", "PCM_24", "FLOAT"],
+                        help="Sample format of wav and flac files, PCM_16 by "
+                        "default; ogg is always Vorbis")
+    parser.add_argument("--stream", action="store_true",
+                        help="Render and write the audio in blocks, for long "
+                        "renders that should not be held in memory, "
+                        "except with PitchShift. Bypasses the cache")
+    parser.add_argument("--width", type=int, default=256, help="Image width")
+    parser.add_argument("--height", type=int, default=256, help="Image height")
+    parser.add_argument("--dpc", type=float, default=0.01,
+                        help="Duration per column (seconds)")
+    parser.add_argument("--sample_rate", type=int, default=44100,
+                        help="Sample rate of the audio")
+    parser.add_argument("--mode", choices=list(MODE_NAMES),
+                        default="left_to_right", help="Traversal Mode")
+    parser.add_argument("--engine", choices=list(ENGINE_NAMES),
+                        default="oscillator", help="Synthesis engine")
+    parser.add_argument("--effect", action="append", default=[],
+                        metavar="NAME[:KEY=VALUE,...]",
+                        help="Add an effect to the chain, in order. "
+                        "For example: --effect reverb:room_size=0.5")
+    parser.add_argument("--preset", metavar="FILE",
+                        help="Effect chain preset saved from the GUI, "
+                        "the --effect options are added after it")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of worker processes")
+    parser.add_argument("--cache-dir", default=default_cache_dir(),
+                        help="Directory of the sonified audio cache")
+    parser.add_argument("--cache-size", type=int, default=1024,
+                        help="Size cap of the audio cache in MB")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not use the sonified audio cache")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Sonify images whose output file already exists")
+
+    args = parser.parse_args()
+
+    try:
+        chain = load_preset(args.preset) if args.preset else []
+        chain += [parse_effect(e) for e in args.effect]
+        build_pedalboard(chain)
+    except OSError as e:
+        parser.error(f"Could not read preset: {e}")
+    except (ValueError, TypeError) as e:
+        parser.error(f"Invalid effect: {e}")
+
+    format = args.format.upper()
+    subtype = "VORBIS" if format == "OGG" else args.subtype or "PCM_16"
+    if not sf.check_format(format, subtype):
+        parser.error(f"{args.format} files cannot hold {subtype} samples")
+
+    images = collect_images(args.inputs)
+    if not images:
+        parser.error("No images found")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    dimension = (args.height, args.width)
+    cache_dir = None if args.no_cache or args.stream else args.cache_dir
+    cache_size = args.cache_size * 1024 ** 2
+
+    jobs = {}
+    for image_path, output_path in output_paths(images, args.output_dir,
+                                                args.format).items():
+        if not args.overwrite and os.path.exists(output_path):
+            continue
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        jobs[image_path] = output_path
+
+    timings = []
+    failed = 0
+    hits = 0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(sonify_file, image_path, output_path, dimension,
+                            args.dpc, args.sample_rate, args.mode, args.engine,
+                            chain, cache_dir, cache_size, format, subtype,
+                            args.stream): image_path
+            for image_path, output_path in jobs.items()
+        }
+
+        for future in as_completed(futures):
+            image_path = futures[future]
+            try:
+                elapsed, hit, stats = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"FAILED  {image_path}: {e}", file=sys.stderr)
+                continue
+
+            timings.append(elapsed)
+            hits += hit
+            decode = "" if hit else f"  ({stats.summary()})"
+            print(f"{elapsed:8.3f}s  {'hit ' if hit else 'miss'}  "
+                  f"{image_path} -> {jobs[image_path]}{decode}")
+
+    wall = time.perf_counter() - start
+    skipped = len(images) - len(jobs)
+
+    print(f"\nSonified {len(timings)} images in {wall:.2f}s "
+          f"({failed} failed, {skipped} skipped)")
+    if timings:
+        print(f"Per image: mean {sum(timings) / len(timings):.3f}s, "
+              f"min {min(timings):.3f}s, max {max(timings):.3f}s")
+    if cache_dir:
+        print(f"Audio cache: {hits} hits, {len(timings) - hits} misses")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
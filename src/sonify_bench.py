@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+import soundfile as sf
+from itertools import product
+from types import SimpleNamespace
+from typing import Callable, Dict
+
+from pedalboard import Pedalboard, Compressor, Reverb
+
+from EffectChain import EFFECTS
+from Renderer import ENGINE_NAMES, TRAVERSAL_MODES, render
+
+GROUPS = ["sonify", "engines", "effects", "callback", "capture"]
+
+
+def _measure(fn: Callable[[], None], repeat: int, number: int = 1) -> Dict:
+    """
+    Time `repeat` rounds of `number` calls, per call, after one warm up
+    call that fills the caches a real run would have warm
+    """
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return {"median": statistics.median(times), "min": min(times),
+            "repeat": repeat, "number": number}
+
+
+def _image(rng: np.random.Generator, height: int, width: int) -> np.ndarray:
+    return rng.integers(0, 256, (height, width), dtype=np.uint8)
+
+
+def bench_sonify(args, rng) -> Dict[str, Dict]:
+    """
+    Every traversal across the grid of dimensions, DPC values and sample
+    rates, with the default engine
+    """
+    if args.quick:
+        sizes, dpcs, sample_rates = [64], [0.01], [44100]
+    else:
+        sizes, dpcs, sample_rates = [128, 256, 512], [0.005, 0.01, 0.02], [22050, 44100, 48000]
+
+    results = {}
+    for size, dpc, sample_rate, mode in product(sizes, dpcs, sample_rates, TRAVERSAL_MODES):
+        image = _image(rng, size, size)
+        name = f"sonify/{mode.name}/{size}x{size}/dpc={dpc}/sr={sample_rate}"
+        results[name] = _measure(
+            lambda: render("", image.shape, dpc, sample_rate, mode, image=image),
+            args.repeat)
+    return results
+
+
+def bench_engines(args, rng) -> Dict[str, Dict]:
+    """
+    The synthesis engines on tall images, 32 columns so the oscillator
+    engine finishes at 4096 rows
+    """
+    rows = [256] if args.quick else [256, 1024, 4096]
+    mode = TRAVERSAL_MODES[0]
+
+    results = {}
+    for height, (engine_name, engine) in product(rows, ENGINE_NAMES.items()):
+        image = _image(rng, height, 32)
+        results[f"engines/{engine_name}/{height}x32"] = _measure(
+            lambda: render("", image.shape, 0.01, 44100, mode, image=image,
+                           engine=engine),
+            args.repeat)
+    return results
+
+
+def bench_effects(args, rng) -> Dict[str, Dict]:
+    """
+    Every effect of the effect menu with its default parameters, over
+    seconds of noise
+    """
+    sample_rate = 44100
+    seconds = 2 if args.quick else 10
+    audio = rng.uniform(-0.5, 0.5, seconds * sample_rate).astype(np.float32)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # Half a second of decaying noise as the impulse response
+        impulse_path = os.path.join(tmp, "impulse.wav")
+        impulse = rng.uniform(-1, 1, sample_rate // 2) * np.exp(-np.linspace(0, 8, sample_rate // 2))
+        sf.write(impulse_path, impulse, sample_rate)
+
+        for name, effect in EFFECTS.items():
+            params = {"impulse_response_filename": impulse_path} if name == "convolution" else {}
+            board = Pedalboard([effect(**params)])
+            results[f"effects/{name}"] = _measure(lambda: board(audio, sample_rate),
+                                                  args.repeat)
+    return results
+
+
+def bench_callback(args, rng) -> Dict[str, Dict]:
+    """
+    One AudioController.callback block, dry, with live effects and
+    playing from a growing buffer. `budget` is the share of the block
+    period the callback takes, `p99` and `late` come from the
+    controller's own telemetry.
+    """
+    import sounddevice as sd
+    from AudioController import AudioController, GrowingBuffer
+
+    sample_rate = 44100
+    audio = rng.uniform(-0.5, 0.5, 10 * sample_rate).astype(np.float32)
+    growing = GrowingBuffer(len(audio))
+    growing.write(0, audio)
+    growing.finish()
+
+    variants = {
+        "dry": lambda c: c.set_params(audio, sample_rate),
+        "live_effects": lambda c: (c.set_params(audio, sample_rate),
+                                   c.set_effects(Pedalboard([Compressor(), Reverb()]))),
+        "stream": lambda c: c.set_stream(growing, sample_rate),
+    }
+
+    results = {}
+    for variant, setup in variants.items():
+        controller = AudioController()
+        setup(controller)
+        controller.playing = True
+        outdata = np.zeros((controller.blocksize, 1), dtype=np.float32)
+        time_info = SimpleNamespace(outputBufferDacTime=0.0)
+        status = SimpleNamespace(output_underflow=False, output_overflow=False)
+
+        def block():
+            try:
+                controller.callback(outdata, controller.blocksize, time_info, status)
+            except sd.CallbackStop:
+                controller.current_frame = 0
+                controller.playing = True
+
+        result = _measure(block, args.repeat, number=200)
+        result["budget"] = result["median"] / (controller.blocksize / sample_rate)
+        # What the controller measured of itself over the same blocks
+        stats = controller.stats()
+        result["p99"] = stats.percentile(0.99)
+        result["late"] = stats.late
+        results[f"callback/{variant}"] = result
+    return results
+
+
+class _FrameSink:
+    """
+    Takes the place of the VideoEncoder, only counts the frames
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.frames = 0
+
+    def push(self, frame: bytes, timestamp=None) -> bool:
+        self.frames += 1
+        return True
+
+
+def bench_capture(args, rng) -> Dict[str, Dict]:
+    """
+    MainWindow._capture_graphicsview on the offscreen Qt platform, `fps`
+    is how many frames it could capture per second
+    """
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtWidgets import QApplication
+    from GUI import MainWindow
+
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    results = {}
+    for size in [256] if args.quick else [256, 512, 1024]:
+        window = MainWindow()
+        window._width = window._height = size
+        window._dimension = (size, size)
+        window.loadImage(_image(rng, size, size))
+        window.resize(size + 100, size + 150)
+        window.show()
+        app.processEvents()
+
+        view = window._graphics_view
+        window._video_encoder = _FrameSink(view.width(), view.height())
+        result = _measure(window._capture_graphicsview, args.repeat, number=20)
+        result["fps"] = 1 / result["median"]
+        results[f"capture/{size}x{size}"] = result
+        window.close()
+    return results
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> int:
+    """
+    Print the change of every benchmark in both result sets and return
+    how many got slower by more than `threshold`
+    """
+    regressions = 0
+    for name in sorted(set(baseline["results"]) | set(current["results"])):
+        old = baseline["results"].get(name)
+        new = current["results"].get(name)
+        if old is None or new is None:
+            print(f"{'new' if old is None else 'gone':>10}  {name}")
+            continue
+
+        ratio = new["median"] / old["median"]
+        slower = ratio > 1 + threshold
+        regressions += slower
+        print(f"{ratio:9.2f}x  {old['median'] * 1000:10.3f} -> "
+              f"{new['median'] * 1000:10.3f} ms  {name}"
+              f"{'  REGRESSION' if slower else ''}")
+
+    print(f"\n{regressions} regressions past {threshold:.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark sonification, effects, playback and capture "
+        "on synthetic images")
+    parser.add_argument("--group", choices=GROUPS, action="append",
+                        help="Benchmark groups to run, all of them by default")
+    parser.add_argument("--quick", action="store_true",
+                        help="Small grids and buffers, for a fast check")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Rounds per benchmark, the median counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output",
+                        help="Write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="Compare against the results in this JSON file "
+                        "and exit with 1 on a regression")
+    parser.add_argument("--current", metavar="RESULTS",
+                        help="With --compare, compare this results file "
+                        "instead of running the benchmarks")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Slowdown past which a benchmark regresses, "
+                        "0.25 is 25%%")
+
+    args = parser.parse_args()
+
+    if args.current:
+        if not args.compare:
+            parser.error("--current needs --compare")
+        with open(args.current) as f:
+            current = json.load(f)
+    else:
+        rng = np.random.default_rng(args.seed)
+        current = {
+            "meta": {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "processor": platform.processor(),
+                "cpus": os.cpu_count(),
+                "quick": args.quick,
+            },
+            "results": {},
+        }
+
+        for group in args.group or GROUPS:
+            try:
+                results = globals()[f"bench_{group}"](args, rng)
+            except (ImportError, OSError) as e:
+                # No audio device library or no Qt platform here
+                print(f"{group}: skipped, {e}", file=sys.stderr)
+                continue
+
+            for name, result in results.items():
+                extra = "".join(f"  {key} {result[key]:.3g}"
+                                for key in ("budget", "fps") if key in result)
+                print(f"{result['median'] * 1000:10.3f} ms  {name}{extra}")
+            current["results"].update(results)
+
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        sys.exit(1 if compare(baseline, current, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
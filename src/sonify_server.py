@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+
+import argparse
+import base64
+import json
+import os
+import shutil
+import signal
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import cv2
+import soundfile as sf
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from AudioCache import default_cache_dir
+from EffectChain import build_pedalboard, parse_chain, parse_effect
+from Renderer import ENGINE_NAMES, MODE_NAMES, sonify_file
+
+# Output formats and the Content-Type they are served with
+FORMATS = {"wav": "audio/wav", "flac": "audio/flac", "ogg": "audio/ogg"}
+
+
+class RequestError(Exception):
+    """
+    Something wrong with a request, answered with 400 and the message
+    """
+
+
+def parse_job(params: Dict, effects: List[str]) -> Dict:
+    """
+    Validated sonify parameters of a request, with the defaults of
+    sonify_batch. `effects` are `name:key=value` specs, added after an
+    `effects` chain in `params`.
+    """
+    def number(name: str, kind, default):
+        try:
+            value = kind(params.get(name, default))
+        except (TypeError, ValueError):
+            raise RequestError(f"{name} must be a number")
+        if value <= 0:
+            raise RequestError(f"{name} must be positive")
+        return value
+
+    def text(name: str, default: str) -> str:
+        value = params.get(name, default)
+        if not isinstance(value, str):
+            raise RequestError(f"{name} must be a string")
+        return value
+
+    job = {
+        "dimension": (number("height", int, 256), number("width", int, 256)),
+        "dpc": number("dpc", float, 0.01),
+        "sample_rate": number("sample_rate", int, 44100),
+        "mode": text("mode", "left_to_right"),
+        "engine": text("engine", "oscillator"),
+        "format": text("format", "wav"),
+        "output": text("output", "audio"),
+        "stream": str(params.get("stream", "")).lower() in ("1", "true", "yes"),
+    }
+    if job["mode"] not in MODE_NAMES:
+        raise RequestError(f"mode must be one of: {', '.join(MODE_NAMES)}")
+    if job["engine"] not in ENGINE_NAMES:
+        raise RequestError(f"engine must be one of: {', '.join(ENGINE_NAMES)}")
+    if job["format"] not in FORMATS:
+        raise RequestError(f"format must be one of: {', '.join(FORMATS)}")
+    if job["output"] not in ("audio", "file"):
+        raise RequestError("output must be audio or file")
+
+    job["subtype"] = ("VORBIS" if job["format"] == "ogg"
+                      else text("subtype", "PCM_16"))
+    if not sf.check_format(job["format"].upper(), job["subtype"]):
+        raise RequestError(f"{job['format']} files cannot hold {job['subtype']} samples")
+
+    try:
+        chain = parse_chain(params, "request") if "effects" in params else []
+        chain += [parse_effect(spec) for spec in effects]
+        build_pedalboard(chain)
+    except (ValueError, TypeError) as e:
+        raise RequestError(str(e))
+    job["chain"] = chain
+    return job
+
+
+def _percentiles(values: List[float]) -> Dict:
+    if not values:
+        return {}
+    values = sorted(values)
+    return {"mean": sum(values) / len(values),
+            "p50": values[len(values) // 2],
+            "p95": values[min(int(len(values) * 0.95), len(values) - 1)],
+            "max": values[-1]}
+
+
+class SonifyService:
+    """
+    Runs sonify requests on a pool of `workers` processes.
+
+    At most `queue_size` requests wait for a worker on top of the ones
+    running; requests past that are turned away at once instead of piling
+    up. Counts and timings of the requests are kept for `metrics`.
+    """
+
+    def __init__(self, workers: int, queue_size: int, output_dir: str,
+                 cache_dir: Optional[str], cache_size: int):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.output_dir = output_dir
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        # Uploaded images and audio on its way back to the client
+        self.spool = tempfile.mkdtemp(prefix="sonify-server-")
+
+        # Ctrl-C is for the server, which shuts the workers down itself
+        self._executor = ProcessPoolExecutor(max_workers=workers,
+                                             initializer=signal.signal,
+                                             initargs=(signal.SIGINT, signal.SIG_IGN))
+        # Start the worker processes now, before the server threads exist
+        for future in [self._executor.submit(os.getpid) for _ in range(workers)]:
+            future.result()
+
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cache_hits = 0
+        # (queue, render, total) seconds of the latest requests
+        self._timings = deque(maxlen=1000)
+
+    def run(self, image_path: str, output_path: str, job: Dict) -> Optional[Dict]:
+        """
+        Sonify an image into `output_path` and return the request's timing,
+        or None if the queue is full. Errors of the job are raised.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return None
+
+        with self._lock:
+            self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            future = self._executor.submit(
+                sonify_file, image_path, output_path, job["dimension"], job["dpc"],
+                job["sample_rate"], job["mode"], job["engine"], job["chain"],
+                self.cache_dir, self.cache_size, job["format"].upper(),
+                job["subtype"], job["stream"])
+            render, hit, stats = future.result()
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+        total = time.perf_counter() - start
+        # Waiting for a worker and handing the job over and back
+        timing = {"queue_seconds": max(total - render, 0.0), "render_seconds": render,
+                  "total_seconds": total, "cache_hit": hit}
+        with self._lock:
+            self.completed += 1
+            self.cache_hits += hit
+            self._timings.append((timing["queue_seconds"], render, total))
+        return timing
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            timings = list(self._timings)
+            in_flight = self.in_flight
+            counts = {"completed": self.completed, "failed": self.failed,
+                      "rejected": self.rejected, "cache_hits": self.cache_hits}
+
+        return {
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "in_flight": in_flight,
+            "running": min(in_flight, self.workers),
+            "queued": max(in_flight - self.workers, 0),
+            **counts,
+            "timing": {name: _percentiles([t[i] for t in timings])
+                       for i, name in enumerate(["queue_seconds", "render_seconds",
+                                                 "total_seconds"])},
+        }
+
+    def close(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
+        shutil.rmtree(self.spool, ignore_errors=True)
+
+
+class SonifyHandler(BaseHTTPRequestHandler):
+    """
+    GET /health, GET /metrics and POST /sonify.
+
+    /sonify takes the image as the raw request body with the parameters in
+    the query string (`effect` can repeat), or a JSON body with the
+    parameters, an `effects` chain like a preset and the image as base64
+    `image` or a local `path`.
+    """
+
+    server_version = "sonify-server"
+
+    @property
+    def service(self) -> SonifyService:
+        return self.server.service
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _send(self, status: int, body: bytes, content_type: str,
+              headers: Optional[Dict] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data: Dict, headers: Optional[Dict] = None) -> None:
+        self._send(status, json.dumps(data).encode(), "application/json", headers)
+
+    def do_GET(self) -> None:
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._send(200, b"ok\n", "text/plain")
+        elif path == "/metrics":
+            self._send_json(200, self.service.metrics())
+        else:
+            self._send_json(404, {"error": f"no such endpoint {path}"})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        if url.path != "/sonify":
+            self._send_json(404, {"error": f"no such endpoint {url.path}"})
+            return
+
+        request_id = uuid.uuid4().hex[:12]
+        upload = None
+        try:
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                raise RequestError("Content-Length must be an integer")
+            if length < 0:
+                raise RequestError("Content-Length must not be negative")
+            if length > self.server.max_upload:
+                raise RequestError(f"request body over {self.server.max_upload} bytes")
+            body = self.rfile.read(length)
+
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                try:
+                    params = json.loads(body)
+                    if not isinstance(params, dict):
+                        raise TypeError("expected an object")
+                    image = base64.b64decode(params["image"]) if "image" in params else None
+                except (ValueError, TypeError) as e:
+                    raise RequestError(f"invalid JSON body: {e}")
+                effects = []
+            else:
+                query = parse_qs(url.query)
+                params = {key: values[-1] for key, values in query.items()}
+                image = body or None
+                effects = query.get("effect", [])
+
+            job = parse_job(params, effects)
+            if image is not None:
+                upload = os.path.join(self.service.spool, f"{request_id}.img")
+                with open(upload, "wb") as f:
+                    f.write(image)
+                image_path = upload
+            elif isinstance(params.get("path"), str) and os.path.isfile(params["path"]):
+                image_path = params["path"]
+            else:
+                raise RequestError("no image: send it as the body, as base64 "
+                                   "'image' or as a local 'path'")
+            if not cv2.haveImageReader(image_path):
+                raise RequestError("image is not in a format that can be decoded")
+        except RequestError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        directory = self.service.output_dir if job["output"] == "file" else self.service.spool
+        output_path = os.path.join(directory, f"{request_id}.{job['format']}")
+        try:
+            timing = self.service.run(image_path, output_path, job)
+        except FileNotFoundError as e:
+            # The image passed the format check but did not decode
+            self._send_json(400, {"id": request_id, "error": str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {"id": request_id, "error": str(e)})
+            return
+        finally:
+            if upload is not None:
+                os.remove(upload)
+
+        if timing is None:
+            self._send_json(503, {"error": "queue full, retry later"}, {"Retry-After": "1"})
+            return
+
+        print(f"{timing['total_seconds']:8.3f}s  queue {timing['queue_seconds']:.3f}s  "
+              f"{'hit ' if timing['cache_hit'] else 'miss'}  {request_id}  "
+              f"{job['mode']} {job['format']} {job['output']}", file=sys.stderr)
+
+        headers = {"X-Request-Id": request_id,
+                   "X-Queue-Seconds": f"{timing['queue_seconds']:.6f}",
+                   "X-Render-Seconds": f"{timing['render_seconds']:.6f}"}
+        if job["output"] == "file":
+            info = sf.info(output_path)
+            self._send_json(200, {"id": request_id, "path": os.path.abspath(output_path),
+                                  "frames": info.frames, "sample_rate": info.samplerate,
+                                  "timing": timing}, headers)
+        else:
+            with open(output_path, "rb") as f:
+                audio = f.read()
+            os.remove(output_path)
+            self._send(200, audio, FORMATS[job["format"]], headers)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve sonification to other local tools over HTTP "
+        "or a Unix socket")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH",
+                        help="Listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of worker processes")
+    parser.add_argument("--queue", type=int, default=16,
+                        help="Requests that can wait for a worker, past that "
+                        "requests get 503")
+    parser.add_argument("-o", "--output-dir", default=".",
+                        help="Directory of the files written for output=file")
+    parser.add_argument("--max-upload", type=int, default=64,
+                        help="Largest request body in MB")
+    parser.add_argument("--cache-dir", default=default_cache_dir(),
+                        help="Directory of the sonified audio cache")
+    parser.add_argument("--cache-size", type=int, default=1024,
+                        help="Size cap of the audio cache in MB")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not use the sonified audio cache")
+
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    service = SonifyService(args.workers, args.queue, args.output_dir,
+                            None if args.no_cache else args.cache_dir,
+                            args.cache_size * 1024 ** 2)
+
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.remove(args.unix)
+        server = UnixHTTPServer(args.unix, SonifyHandler)
+        where = args.unix
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), SonifyHandler)
+        where = f"http://{args.host}:{server.server_address[1]}"
+    server.service = service
+    server.max_upload = args.max_upload * 1024 ** 2
+
+    print(f"Serving on {where} with {args.workers} workers, "
+          f"{args.queue} queued requests at most", file=sys.stderr)
+    # Clean up on a plain kill too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from pedalboard import Pedalboard, PitchShift, Reverb
+
+try:
+    from AudioController import AudioController
+except OSError:
+    # sounddevice loads PortAudio when imported
+    pytest.skip("PortAudio is not available", allow_module_level=True)
+
+SAMPLE_RATE = 44100
+BLOCK = 1024
+TIME = SimpleNamespace(outputBufferDacTime=0.0)
+STATUS = SimpleNamespace(output_underflow=False, output_overflow=False)
+
+
+def play(controller, blocks, pace=0.0):
+    out = np.zeros((BLOCK, 1), dtype=np.float32)
+    played = []
+    for _ in range(blocks):
+        time.sleep(pace)
+        controller.callback(out, BLOCK, TIME, STATUS)
+        played.append(out[:, 0].copy())
+    return np.concatenate(played)
+
+
+def test_latency_plugin_fills_every_block():
+    audio = np.random.default_rng(0).uniform(-0.5, 0.5, SAMPLE_RATE * 2).astype(np.float32)
+    controller = AudioController(audio, SAMPLE_RATE)
+    controller.set_params(audio, SAMPLE_RATE)
+    controller.set_effects(Pedalboard([PitchShift(semitones=3), Reverb()]))
+    controller.playing = True
+
+    played = play(controller, 60)
+
+    assert len(played) == 60 * BLOCK
+    assert controller.current_frame == 60 * BLOCK
+    # PitchShift hands back nothing at first, that much silence was put in
+    assert controller.effects_latency > 0
+    assert np.all(played[:controller.effects_latency] == 0)
+
+
+def test_latency_plugin_is_heard_after_latency():
+    t = np.arange(SAMPLE_RATE * 3) / SAMPLE_RATE
+    audio = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    controller = AudioController(audio, SAMPLE_RATE)
+    controller.set_params(audio, SAMPLE_RATE)
+    controller.set_effects(Pedalboard([PitchShift(semitones=12)]))
+    controller.playing = True
+
+    # At the pace of a device, so the chunks have the time to render
+    played = play(controller, 80, pace=BLOCK / SAMPLE_RATE)
+
+    heard = played[controller.effects_latency:]
+    assert len(heard) > SAMPLE_RATE // 4
+    assert np.sqrt(np.mean(heard ** 2)) > 0.1
+    spectrum = np.abs(np.fft.rfft(heard * np.hanning(len(heard))))
+    assert abs(np.argmax(spectrum) * SAMPLE_RATE / len(heard) - 880) < 20
+
+
+def test_effects_without_latency_keep_position():
+    audio = np.random.default_rng(1).uniform(-0.5, 0.5, SAMPLE_RATE).astype(np.float32)
+    controller = AudioController(audio, SAMPLE_RATE)
+    controller.set_params(audio, SAMPLE_RATE)
+    controller.set_effects(Pedalboard([Reverb()]))
+    controller.playing = True
+
+    played = play(controller, 10)
+
+    assert controller.effects_latency == 0
+    expected = Pedalboard([Reverb()])(audio[:10 * BLOCK], SAMPLE_RATE)
+    np.testing.assert_allclose(played, expected, atol=1e-5)
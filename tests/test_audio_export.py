@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from pedalboard import Pedalboard, PitchShift, Reverb
+from visound.core.TraversalMode import TraversalMode
+
+from AudioExport import apply_effects, array_blocks, render_blocks
+from Renderer import render
+
+DPC = 0.01
+SAMPLE_RATE = 44100
+
+
+@pytest.fixture(scope="module")
+def image():
+    return np.random.default_rng(0).integers(0, 256, (32, 500), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("chain", [[PitchShift(semitones=3)], [Reverb(), PitchShift(semitones=-2)],
+                                   [Reverb()]],
+                         ids=["pitchshift", "reverb-pitchshift", "reverb"])
+def test_effect_blocks_match_the_render(image, chain):
+    rendered = render(None, image.shape, DPC, SAMPLE_RATE, TraversalMode.LeftToRight,
+                      Pedalboard(chain), image=image)
+
+    blocks = apply_effects(render_blocks(image, TraversalMode.LeftToRight, DPC, SAMPLE_RATE),
+                           Pedalboard(chain), SAMPLE_RATE)
+
+    np.testing.assert_allclose(np.concatenate(list(blocks)), rendered, atol=1e-5)
+
+
+def test_effect_blocks_match_the_render_for_small_blocks():
+    audio = np.random.default_rng(1).uniform(-0.5, 0.5, SAMPLE_RATE * 2).astype(np.float32)
+    chain = [PitchShift(semitones=5)]
+
+    blocks = list(apply_effects(array_blocks(audio, 1024), Pedalboard(chain), SAMPLE_RATE))
+
+    np.testing.assert_allclose(np.concatenate(blocks), Pedalboard(chain)(audio, SAMPLE_RATE),
+                               atol=1e-5)
@@ -0,0 +1,48 @@
+import numpy as np
+from pedalboard import Pedalboard, PitchShift, Reverb
+
+from EffectChain import EffectStream
+
+SAMPLE_RATE = 44100
+BLOCK = 1024
+
+
+def stream(pedalboard, audio):
+    effects = EffectStream(pedalboard, SAMPLE_RATE, realtime=False)
+    out = np.zeros_like(audio)
+    for start in range(0, len(audio), BLOCK):
+        effects.process(audio[start:start + BLOCK], out[start:start + BLOCK])
+    return out, effects.latency
+
+
+def spectra(audio, size=4096):
+    windows = [audio[i:i + size] * np.hanning(size) for i in range(0, len(audio) - size, size)]
+    spectra = np.abs(np.fft.rfft(windows, axis=1))
+    return spectra / np.linalg.norm(spectra, axis=1, keepdims=True)
+
+
+def test_pitchshift_stream_sounds_like_whole_render():
+    t = np.arange(SAMPLE_RATE * 4) / SAMPLE_RATE
+    audio = (0.3 * np.sin(2 * np.pi * 440 * t)
+             + 0.2 * np.sin(2 * np.pi * (300 + 100 * t) * t)).astype(np.float32)
+    chain = [Reverb(room_size=0.3), PitchShift(semitones=3)]
+
+    streamed, latency = stream(Pedalboard(chain), audio)
+    whole = Pedalboard(chain)(audio, SAMPLE_RATE)
+
+    assert 0 < latency < SAMPLE_RATE
+    assert np.all(streamed[:latency] == 0)
+    # The streamed output is the whole render running `latency` frames late
+    heard = streamed[latency:]
+    similarity = np.sum(spectra(heard) * spectra(whole[:len(heard)]), axis=1)
+    assert similarity.mean() > 0.85
+    assert similarity.min() > 0.5
+
+
+def test_stream_without_latency_matches_whole_render():
+    audio = np.random.default_rng(2).uniform(-0.5, 0.5, SAMPLE_RATE).astype(np.float32)
+
+    streamed, latency = stream(Pedalboard([Reverb()]), audio)
+
+    assert latency == 0
+    np.testing.assert_allclose(streamed, Pedalboard([Reverb()])(audio, SAMPLE_RATE), atol=1e-5)
@@ -0,0 +1,57 @@
+import cv2
+import numpy as np
+import pytest
+from visound.core.TraversalMode import TraversalMode
+from visound.core.sonify import Sonify
+
+from Renderer import TRAVERSAL_MODES
+from Synthesis import SynthesisEngine, pixel_to_freq, synthesize, total_samples
+
+SIZE = 24
+DPC = 0.01
+SAMPLE_RATE = 8000
+
+
+@pytest.fixture(scope="module")
+def image_path(tmp_path_factory):
+    image = np.random.default_rng(0).integers(0, 256, (SIZE, SIZE), dtype=np.uint8)
+    path = str(tmp_path_factory.mktemp("images") / "square.png")
+    cv2.imwrite(path, image)
+    return path
+
+
+@pytest.mark.parametrize("mode", TRAVERSAL_MODES, ids=lambda mode: mode.name)
+def test_synthesize_matches_sonify(image_path, mode):
+    sonify = Sonify(image_path, (SIZE, SIZE), DPC, SAMPLE_RATE)
+    expected = getattr(sonify, mode.name)()
+    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+
+    audio = synthesize(image, mode, DPC, SAMPLE_RATE)
+
+    assert len(audio) == len(expected) == total_samples(image.shape, mode, DPC, SAMPLE_RATE)
+    scale = np.abs(expected).max()
+    np.testing.assert_allclose(audio, expected, rtol=0, atol=1e-6 * scale)
+
+
+@pytest.mark.parametrize("mode", TRAVERSAL_MODES, ids=lambda mode: mode.name)
+def test_dpc_below_one_sample_gives_empty_audio(mode):
+    image = np.full((SIZE, SIZE), 128, dtype=np.uint8)
+
+    audio = synthesize(image, mode, 1e-6, SAMPLE_RATE, progress=lambda done, total: True)
+
+    assert len(audio) == 0
+
+
+@pytest.mark.parametrize("row", [10, 500, 1000])
+def test_ifft_plays_the_row_frequency_to_a_bin(row):
+    image = np.zeros((1024, 64), dtype=np.uint8)
+    image[row] = 255
+    sample_rate = 44100
+
+    audio = synthesize(image, TraversalMode.LeftToRight, DPC, sample_rate, SynthesisEngine.IFFT)
+
+    steady = audio[len(audio) // 4:-len(audio) // 4]
+    spectrum = np.abs(np.fft.rfft(steady * np.hanning(len(steady)), n=1 << 18))
+    peak = np.argmax(spectrum) * sample_rate / (1 << 18)
+    # Bins are sample_rate / 4096 apart with the default oversampling
+    assert abs(peak - pixel_to_freq(row, 1024)) <= sample_rate / 4096 / 2 + 1